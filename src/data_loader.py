@@ -1,13 +1,19 @@
 import pandas as pd
-import nltk
-import random
+import numpy as np
 import os # Added for path joining
+import csv
+import functools
 
-# Ensure NLTK's sentence tokenizer is available
+# PyArrow is optional: when installed, pandas can use its multi-threaded CSV parser
+# and the preprocessed dataset can be cached as Parquet between runs
 try:
-    nltk.data.find('tokenizers/punkt')
-except nltk.downloader.DownloadError:
-    nltk.download('punkt')
+    import pyarrow # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+CSV_ENGINE = "pyarrow" if PYARROW_AVAILABLE else "c"
+# Arrow strings keep 'Answer' in one contiguous buffer instead of one Python object per row
+ANSWER_DTYPE = "string[pyarrow]" if PYARROW_AVAILABLE else "string"
 
 # Path to the local data file
 # Assuming the script is run from a context where this relative path is valid
@@ -16,6 +22,10 @@ except nltk.downloader.DownloadError:
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(CURRENT_DIR) # This goes up from src to journal_generator
 LOCAL_DATA_FILE = os.path.join(PROJECT_ROOT, "data", "data.csv") # User placed it in data/data.csv
+# Preprocessed copy of LOCAL_DATA_FILE, reused while it is newer than the CSV. None disables caching.
+DATA_CACHE_FILE = os.path.join(PROJECT_ROOT, "data", "_data_cache.parquet") if PYARROW_AVAILABLE else None
+# zstd keeps the mostly-text cache small while still decompressing far faster than the CSV parses
+CACHE_COMPRESSION = "zstd"
 
 EMOTION_COLUMNS = [
     'Answer.f1.afraid.raw',
@@ -40,10 +50,50 @@ EMOTION_COLUMNS = [
 
 ALL_AVAILABLE_EMOTIONS = [col.split('.')[2] for col in EMOTION_COLUMNS]
 
+# Lowercase emotion name -> its dataset column, so lookups don't rebuild the column name on every call
+TONE_TO_COLUMN = dict(zip(ALL_AVAILABLE_EMOTIONS, EMOTION_COLUMNS))
+
+# Bit position of each emotion in the packed per-row mask from build_emotion_bitmask (18 bits fit in a uint32)
+EMOTION_BITS = {emotion: bit for bit, emotion in enumerate(ALL_AVAILABLE_EMOTIONS)}
+
+# Shared default random generator for example sampling; pass your own (e.g. seeded) rng for reproducible draws
+_RNG = np.random.default_rng()
+
+# The only columns the pipeline uses; anything else in the CSV (e.g. topic labels) is never parsed
+NEEDED_COLUMNS = frozenset(['Answer', *EMOTION_COLUMNS])
+
+# Spellings decoded to booleans by the CSV parser itself, so clean columns arrive as bool
+# and skip the Python-level preprocessing pass. 'NAN' in the seed data means unlabelled.
+TRUE_VALUES = ['TRUE', 'True', 'true']
+FALSE_VALUES = ['FALSE', 'False', 'false']
+NA_VALUES = ['NAN']
+
+# Parser options for every seed-data read
+CSV_READ_OPTIONS = {
+    'engine': CSV_ENGINE,
+    'true_values': TRUE_VALUES,
+    'false_values': FALSE_VALUES,
+    'na_values': NA_VALUES,
+    # Parse 'Answer' straight into its final string dtype rather than object strings converted afterwards
+    'dtype': {'Answer': ANSWER_DTYPE},
+}
+if CSV_ENGINE == "c":
+    # Parse straight from a memory-mapped file instead of copying it through read buffers.
+    # (The pyarrow engine doesn't take this option; its native reader already streams the file in blocks.)
+    CSV_READ_OPTIONS['memory_map'] = True
+
+# CSVs at least this large are parsed in chunks of CSV_CHUNK_ROWS rows, decoding each chunk's emotion
+# columns before the next is read, so undecoded string columns for the whole file are never held at once
+CHUNKED_READ_MIN_BYTES = 256 * 1024 * 1024
+CSV_CHUNK_ROWS = 256_000
+
 def load_and_preprocess_data() -> pd.DataFrame:
     """
     Loads the dataset from the local CSV file and performs basic preprocessing.
     Converts emotion columns from TRUE/FALSE strings to booleans.
+    The result is cached to DATA_CACHE_FILE (Parquet) and reused until the CSV changes.
+    Within a process, repeat calls return the same DataFrame until the CSV changes,
+    so callers should not modify it in place.
 
     Returns:
         pd.DataFrame: The loaded and preprocessed DataFrame.
@@ -61,7 +111,28 @@ def load_and_preprocess_data() -> pd.DataFrame:
         raise FileNotFoundError(f"Could not load {data_file_path}. File does not exist.")
 
     try:
-        df = pd.read_csv(data_file_path)
+        mtime_ns = os.stat(data_file_path).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    return _load_and_preprocess_file(data_file_path, mtime_ns)
+
+@functools.lru_cache(maxsize=1)
+def _load_and_preprocess_file(data_file_path: str, mtime_ns: int | None) -> pd.DataFrame:
+    """
+    Does the actual load for load_and_preprocess_data. Memoized on (path, mtime) so
+    the CSV is parsed at most once per process unless it changes on disk.
+    """
+    cache_file_path = DATA_CACHE_FILE
+    if cache_file_path and _is_cache_fresh(cache_file_path, data_file_path):
+        try:
+            df = pd.read_parquet(cache_file_path)
+            print(f"Loaded preprocessed dataset from cache: {cache_file_path}. Shape: {df.shape}")
+            return df
+        except Exception as e:
+            print(f"Warning: Could not read dataset cache {cache_file_path}: {e}. Re-parsing CSV.")
+
+    try:
+        df = _read_csv(data_file_path)
         print(f"Local dataset loaded successfully. Shape: {df.shape}")
 
     except Exception as e:
@@ -71,22 +142,207 @@ def load_and_preprocess_data() -> pd.DataFrame:
     if 'Answer' not in df.columns:
         raise KeyError("Critical column 'Answer' not found in the dataset.")
 
-    # Preprocess emotion columns: Convert string 'TRUE'/'FALSE' to boolean
     for col in EMOTION_COLUMNS:
-        if col in df.columns:
-            if df[col].dtype == 'object': # Check if column is object type (likely strings)
-                # Handle potential mixed case like 'True' or 'False' and also NaN before mapping
-                df[col] = df[col].astype(str).str.upper().map({'TRUE': True, 'FALSE': False, 'NAN': False}).fillna(False)
-            elif pd.api.types.is_numeric_dtype(df[col]): # If it's numeric (0/1)
-                 df[col] = df[col].astype(bool)
-            # If already boolean, no change needed
-        else:
+        if col not in df.columns:
             print(f"Warning: Emotion column {col} not found in the dataset. It will be ignored.")
 
-    df['Answer'] = df['Answer'].astype(str).str.strip()
+    df['Answer'] = df['Answer'].astype(ANSWER_DTYPE).fillna("").str.strip() # astype is a no-op after a fresh parse
+
+    if cache_file_path:
+        _write_cache(df, cache_file_path)
     return df
 
-def get_examples_for_prompt(df: pd.DataFrame, target_emotion: str, num_examples: int = 3) -> list[str]:
+def _write_cache(df: pd.DataFrame, cache_file_path: str) -> None:
+    """
+    Writes df to the Parquet cache. The file is written under a temporary name and then renamed into place,
+    so an interrupted write can never leave a truncated cache that looks newer than the CSV.
+    """
+    tmp_file_path = f"{cache_file_path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_file_path, index=False, compression=CACHE_COMPRESSION)
+        os.replace(tmp_file_path, cache_file_path)
+    except Exception as e:
+        print(f"Warning: Could not write dataset cache {cache_file_path}: {e}")
+        try:
+            os.remove(tmp_file_path)
+        except OSError:
+            pass
+
+def _read_csv(data_file_path: str) -> pd.DataFrame:
+    """Reads the needed columns of the seed CSV, with every emotion column present decoded to bool."""
+    usecols = _columns_to_read(data_file_path)
+    if os.path.getsize(data_file_path) < CHUNKED_READ_MIN_BYTES:
+        return _decode_emotion_columns(pd.read_csv(data_file_path, usecols=usecols, **CSV_READ_OPTIONS))
+
+    # The pyarrow engine doesn't support chunksize, so large files always go through the C parser
+    chunked_options = dict(CSV_READ_OPTIONS, engine="c", memory_map=True)
+    chunks = pd.read_csv(data_file_path, usecols=usecols, chunksize=CSV_CHUNK_ROWS, **chunked_options)
+    return pd.concat([_decode_emotion_columns(chunk) for chunk in chunks], ignore_index=True)
+
+def _decode_emotion_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts the emotion columns the parser could not decode (e.g. columns with missing values,
+    or 0/1 numeric columns) to boolean, in place. Returns df for convenience.
+    """
+    for col in EMOTION_COLUMNS:
+        if col not in df.columns or pd.api.types.is_bool_dtype(df[col]):
+            continue # Missing columns are reported by the caller; boolean ones need no change
+        if pd.api.types.is_numeric_dtype(df[col]): # If it's numeric (0/1)
+            # A chunk whose labels are all NAN parses as float; NaN must read as False, not True
+            df[col] = df[col].fillna(0).astype(bool)
+        else:
+            # Strings: one vectorized compare instead of a per-element dict lookup.
+            # Handles mixed case like 'True'/'true'; NaN and anything that isn't 'TRUE' become False.
+            df[col] = df[col].astype("string").str.upper().eq("TRUE").fillna(False).astype(bool)
+    return df
+
+def _columns_to_read(data_file_path: str) -> list[str]:
+    """
+    Returns the header columns of the CSV that are in NEEDED_COLUMNS, in file order.
+    Reading the header ourselves lets read_csv take a plain list (which every engine supports)
+    while still tolerating emotion columns that are missing from the file.
+    """
+    with open(data_file_path, newline='', encoding='utf-8-sig') as f:
+        header = next(csv.reader(f), [])
+    return [col for col in header if col in NEEDED_COLUMNS]
+
+def _is_cache_fresh(cache_file_path: str, data_file_path: str) -> bool:
+    """Returns True if the cache file exists and is at least as new as the source CSV."""
+    try:
+        return os.stat(cache_file_path).st_mtime_ns >= os.stat(data_file_path).st_mtime_ns
+    except OSError:
+        return False
+
+def build_emotion_index(df: pd.DataFrame) -> dict[str, np.ndarray]:
+    """
+    Precomputes, for each emotion column present, the row positions labelled with that emotion.
+    Build it once after loading so get_examples_for_prompt doesn't rescan the column on every call.
+
+    Args:
+        df (pd.DataFrame): The preprocessed DataFrame (boolean emotion columns).
+
+    Returns:
+        dict[str, np.ndarray]: Maps lowercase emotion name to an int array of matching row positions.
+    """
+    return {
+        emotion: np.flatnonzero(df[col].to_numpy(dtype=bool))
+        for emotion, col in zip(ALL_AVAILABLE_EMOTIONS, EMOTION_COLUMNS)
+        if col in df.columns
+    }
+
+class EmotionSampler:
+    """
+    Draws example entries by emotion from a preprocessed DataFrame.
+    The first sample() for an emotion builds that emotion's example pool (its answers as an array of
+    strings) and caches it, so later draws sample the pool directly instead of touching the DataFrame.
+    """
+
+    def __init__(self, df: pd.DataFrame, rng: np.random.Generator | None = None):
+        """
+        Args:
+            df (pd.DataFrame): The preprocessed DataFrame (see load_and_preprocess_data).
+            rng (np.random.Generator | None): Random generator to draw with. Defaults to a shared unseeded one.
+        """
+        self._df = df
+        self._pools: dict[str, np.ndarray] = {}
+        self._bitmask: np.ndarray | None = None # Built on the first multi-emotion query
+        self._rng = rng if rng is not None else _RNG
+
+    def example_pool(self, target_emotion: str) -> np.ndarray | None:
+        """
+        Returns every answer labelled with target_emotion (case-insensitive) as an object array,
+        or None if the dataset has no column for it. Built on first use, then cached.
+        """
+        emotion = target_emotion.lower()
+        if emotion not in self._pools:
+            col = _emotion_column(emotion)
+            if col not in self._df.columns:
+                return None
+            matching_rows = np.flatnonzero(self._df[col].to_numpy(dtype=bool))
+            self._pools[emotion] = self._df['Answer'].iloc[matching_rows].to_numpy(dtype=object)
+        return self._pools[emotion]
+
+    def sample(self, target_emotion: str, num_examples: int = 3) -> list[str]:
+        """
+        Retrieves up to num_examples random example entries for target_emotion (case-insensitive).
+
+        Returns:
+            list[str]: A list of example journal entry texts. Returns empty list if no matches.
+        """
+        if num_examples <= 0:
+            return []
+
+        pool = self.example_pool(target_emotion)
+        if pool is None:
+            print(f"Warning: Emotion column for '{target_emotion}' not found. Cannot fetch examples.")
+            return []
+        return _choose_examples(pool, target_emotion, num_examples, self._rng).tolist()
+
+    def sample_all(self, target_emotions: list[str], num_examples: int = 3) -> list[str]:
+        """
+        Retrieves up to num_examples random example entries labelled with every one of target_emotions
+        (case-insensitive), e.g. ['happy', 'nostalgic'], using the packed emotion bitmask.
+
+        Returns:
+            list[str]: A list of example journal entry texts. Returns empty list if no matches.
+
+        Raises:
+            KeyError: If an emotion is not one of ALL_AVAILABLE_EMOTIONS.
+        """
+        if num_examples <= 0:
+            return []
+
+        if self._bitmask is None:
+            self._bitmask = build_emotion_bitmask(self._df)
+        matching_rows = find_rows_with_emotions(self._bitmask, target_emotions)
+        return _sample_answers(self._df['Answer'], matching_rows, " + ".join(target_emotions), num_examples, self._rng)
+
+def build_emotion_bitmask(df: pd.DataFrame) -> np.ndarray:
+    """
+    Packs all emotion columns into a single uint32 per row, with bit EMOTION_BITS[emotion] set
+    when the row is labelled with that emotion. Emotions whose column is missing are left unset.
+
+    Args:
+        df (pd.DataFrame): The preprocessed DataFrame (boolean emotion columns).
+
+    Returns:
+        np.ndarray: uint32 array with one packed emotion mask per row.
+    """
+    present = [(bit, col) for bit, col in enumerate(EMOTION_COLUMNS) if col in df.columns]
+    # One (rows, 32) boolean matrix with each emotion in its bit's column, converted from the frame in
+    # a single 2-D copy; packbits then turns every row into 4 little-endian bytes, i.e. one uint32
+    emotion_matrix = np.zeros((len(df), 32), dtype=bool)
+    if present:
+        emotion_matrix[:, [bit for bit, _ in present]] = df[[col for _, col in present]].to_numpy(dtype=bool)
+    return np.packbits(emotion_matrix, axis=1, bitorder='little').view('<u4').reshape(-1).astype(np.uint32)
+
+def find_rows_with_emotions(bitmask: np.ndarray, emotions: list[str]) -> np.ndarray:
+    """
+    Finds the rows labelled with every one of the given emotions using the packed bitmask,
+    so a multi-emotion query is one vectorized AND/compare instead of one scan per column.
+
+    Args:
+        bitmask (np.ndarray): Packed masks from build_emotion_bitmask.
+        emotions (list[str]): Emotions that must all be present. Case-insensitive.
+
+    Returns:
+        np.ndarray: Positions of the matching rows.
+
+    Raises:
+        KeyError: If an emotion is not one of ALL_AVAILABLE_EMOTIONS.
+    """
+    required_bits = np.uint32(0)
+    for emotion in emotions:
+        required_bits |= np.uint32(1 << EMOTION_BITS[emotion.lower()])
+    return np.flatnonzero((bitmask & required_bits) == required_bits)
+
+def get_examples_for_prompt(
+    df: pd.DataFrame,
+    target_emotion: str,
+    num_examples: int = 3,
+    emotion_index: dict[str, np.ndarray] | None = None,
+    rng: np.random.Generator | None = None
+) -> list[str]:
     """
     Retrieves a specified number of example journal entries for a given target emotion.
 
@@ -94,6 +350,9 @@ def get_examples_for_prompt(df: pd.DataFrame, target_emotion: str, num_examples:
         df (pd.DataFrame): The DataFrame containing journal entries and emotion labels.
         target_emotion (str): The desired emotion (e.g., 'Happy', 'Sad'). Case-insensitive.
         num_examples (int): The number of example entries to retrieve.
+        emotion_index (dict[str, np.ndarray] | None): Optional index from build_emotion_index(df).
+            When it covers the target emotion, the emotion column is not rescanned.
+        rng (np.random.Generator | None): Random generator to draw with. Defaults to a shared unseeded one.
 
     Returns:
         list[str]: A list of example journal entry texts. Returns empty list if no matches or errors.
@@ -101,30 +360,56 @@ def get_examples_for_prompt(df: pd.DataFrame, target_emotion: str, num_examples:
     if num_examples <= 0:
         return []
 
-    target_emotion_col_name = f"Answer.f1.{target_emotion.lower()}.raw"
+    rng = rng if rng is not None else _RNG
+    if emotion_index is not None and target_emotion.lower() in emotion_index:
+        return _sample_answers(df['Answer'], emotion_index[target_emotion.lower()], target_emotion, num_examples, rng)
+
+    target_emotion_col_name = _emotion_column(target_emotion.lower())
 
     if target_emotion_col_name not in df.columns:
         print(f"Warning: Emotion column for '{target_emotion}' ({target_emotion_col_name}) not found. Cannot fetch examples.")
         return []
 
-    if not pd.api.types.is_bool_dtype(df[target_emotion_col_name]):
-        print(f"Warning: Emotion column {target_emotion_col_name} is not boolean. Cannot reliably filter.")
-        if pd.api.types.is_numeric_dtype(df[target_emotion_col_name]):
-            df[target_emotion_col_name] = df[target_emotion_col_name].astype(bool)
-        else:
-            return [] 
+    # load_and_preprocess_data already decodes every emotion column to bool, so this is only a debug-time check
+    assert pd.api.types.is_bool_dtype(df[target_emotion_col_name]), \
+        f"Emotion column {target_emotion_col_name} is not boolean; load the data with load_and_preprocess_data()."
+
+    matching_rows = np.flatnonzero(df[target_emotion_col_name].to_numpy(dtype=bool))
+    return _sample_answers(df['Answer'], matching_rows, target_emotion, num_examples, rng)
 
-    filtered_df = df[df[target_emotion_col_name] == True]
+def _emotion_column(emotion: str) -> str:
+    """Returns the column name for a lowercase emotion; names outside EMOTION_COLUMNS follow the same pattern."""
+    return TONE_TO_COLUMN.get(emotion) or f"Answer.f1.{emotion}.raw"
 
-    if filtered_df.empty:
+def _sample_answers(
+    answers: pd.Series,
+    matching_rows: np.ndarray,
+    target_emotion: str,
+    num_examples: int,
+    rng: np.random.Generator
+) -> list[str]:
+    """
+    Randomly picks up to num_examples entries of answers at the matching_rows positions.
+    Row positions are sampled first so only the chosen answers are materialized as Python strings.
+    """
+    return answers.iloc[_choose_examples(matching_rows, target_emotion, num_examples, rng)].tolist()
+
+def _choose_examples(
+    candidates: np.ndarray,
+    target_emotion: str,
+    num_examples: int,
+    rng: np.random.Generator
+) -> np.ndarray:
+    """Picks num_examples of candidates without replacement, or all of them (with a warning) if there are fewer."""
+    if candidates.size == 0:
         print(f"No entries found for emotion: {target_emotion}")
-        return []
+        return candidates
 
-    if len(filtered_df) < num_examples:
-        print(f"Warning: Found only {len(filtered_df)} entries for emotion '{target_emotion}', requested {num_examples}. Using all found.")
-        return filtered_df['Answer'].tolist()
+    if candidates.size < num_examples:
+        print(f"Warning: Found only {candidates.size} entries for emotion '{target_emotion}', requested {num_examples}. Using all found.")
+        return candidates
     
-    return random.sample(filtered_df['Answer'].tolist(), num_examples)
+    return rng.choice(candidates, size=num_examples, replace=False)
 
 if __name__ == '__main__':
     try:
@@ -1,4 +1,6 @@
 import os
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 # from datetime import datetime # No longer needed directly here
 # import json # No longer needed for counter
 
@@ -26,7 +28,11 @@ class JournalExporter:
         except OSError as e:
             print(f"Error creating output directory '{self.output_dir}': {e}")
             raise
-        # Removed self.global_counter initialization
+        # One timestamp per exporter plus an in-memory sequence number: IDs stay unique across runs
+        # (timestamp) and within a run (sequence) without reading the clock for every entry
+        self._run_id = utils.get_current_datetime_str_for_file_id()
+        self._sequence = itertools.count(1)
+        self._filename_for = utils.make_filename_factory() # Prefix defaults to "journal"
         print(f"Exporter initialized. Output will be saved to: {os.path.abspath(self.output_dir)}.")
 
     # _load_counter and _save_counter methods are removed
@@ -37,7 +43,7 @@ class JournalExporter:
         # date_str, entry_index_in_day, total_entries_for_day are removed
     ) -> str | None:
         """
-        Saves a single journal entry to a .txt file using a unique timestamp ID.
+        Saves a single journal entry to a .txt file using a unique ID (run timestamp + sequence number).
 
         Args:
             entry_text (str): The content of the journal entry.
@@ -50,13 +56,57 @@ class JournalExporter:
             return None
 
         # Removed self.global_counter increment
-        unique_id_str = utils.get_current_datetime_str_for_file_id()
-        filename = utils.construct_filename(unique_id_str) # Prefix defaults to "journal"
-        filepath = os.path.join(self.output_dir, filename)
+        return self._write_entry(self._next_filepath(), entry_text)
 
+    def save_entries(self, entry_texts: list[str], max_workers: int = 8, durable: bool = False) -> list[str | None]:
+        """
+        Saves several journal entries, writing the files concurrently on a thread pool.
+        File writes are I/O-bound, so this overlaps the per-file open/write/close cost.
+        Filenames are assigned up front in input order, so they sort the same way the entries were given.
+
+        Args:
+            entry_texts (list[str]): The contents of the journal entries.
+            max_workers (int): Maximum number of concurrent writer threads.
+            durable (bool): If True, flush every file to disk before returning. The per-file fsyncs run
+                concurrently on the pool, and the output directory is synced once for the whole batch.
+
+        Returns:
+            list[str | None]: The saved path for each entry, in input order (None where it was skipped or failed).
+        """
+        filepaths = []
+        for entry_text in entry_texts:
+            if entry_text:
+                filepaths.append(self._next_filepath())
+            else:
+                print("Warning: Attempted to save an empty entry. Skipping.")
+                filepaths.append(None)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self._write_entry, filepath, entry_text, durable) if filepath else None
+                for filepath, entry_text in zip(filepaths, entry_texts)
+            ]
+        saved_paths = [future.result() if future else None for future in futures]
+        if durable and any(saved_paths):
+            self._sync_output_dir() # Makes the new directory entries themselves durable
+        return saved_paths
+
+    def _next_filepath(self) -> str:
+        """Builds the path for the next entry, e.g. journal_YYYYMMDD_HHMMSSffffff_000001.txt."""
+        unique_id_str = f"{self._run_id}_{next(self._sequence):06d}"
+        filename = self._filename_for(unique_id_str)
+        return os.path.join(self.output_dir, filename)
+
+    def _write_entry(self, filepath: str, entry_text: str, durable: bool = False) -> str | None:
+        """Writes one entry to filepath, fsyncing it if durable. Returns the path if successful, None otherwise."""
+        filename = os.path.basename(filepath)
         try:
+            # Text mode, so newlines are written in the platform's convention (CRLF on Windows)
             with open(filepath, 'w', encoding='utf-8') as f:
                 f.write(entry_text)
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
             
             # Removed self._save_counter()
             print(f"Journal entry saved to: {filepath}")
@@ -68,6 +118,19 @@ class JournalExporter:
             print(f"An unexpected error occurred during save_entry: {e}")
             return None
 
+    def _sync_output_dir(self) -> None:
+        """Fsyncs the output directory so newly created files survive a crash. No-op where unsupported (e.g. Windows)."""
+        try:
+            dir_fd = os.open(self.output_dir, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError as e:
+            print(f"Warning: Could not sync output directory '{self.output_dir}': {e}")
+        finally:
+            os.close(dir_fd)
+
 if __name__ == '__main__':
     print("Testing JournalExporter with Timestamp-based IDs...")
     test_output_dir = "_test_generated_entries_exporter_timestamp"
@@ -85,12 +148,8 @@ if __name__ == '__main__':
     entry1_path = exporter.save_entry("Test entry with timestamp ID 1.")
     if entry1_path: print(f"Saved: {entry1_path}")
 
-    # Introduce a small delay to ensure the next timestamp is different if run very fast
-    import time
-    time.sleep(0.001) 
-
     print(f"\nSaving entry 2...")
     entry2_path = exporter.save_entry("Test entry with timestamp ID 2.")
     if entry2_path: print(f"Saved: {entry2_path}")
 
-    print(f"\nCheck the directory '{os.path.abspath(test_output_dir)}' for the generated files (e.g., journal_YYYYMMDD_HHMMSSffffff.txt).") 
\ No newline at end of file
+    print(f"\nCheck the directory '{os.path.abspath(test_output_dir)}' for the generated files (e.g., journal_YYYYMMDD_HHMMSSffffff_000001.txt).") 
\ No newline at end of file
@@ -1,6 +1,10 @@
-import google.generativeai as genai
 import os
 import time # For potential retries
+import asyncio
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import google.generativeai as genai
 
 
 # Try to import from local src package first, then parent directory if running script directly
@@ -14,16 +18,28 @@ MODEL_NAME = "gemini-1.5-flash-latest"
 
 print(f"Using LLM Model via API: {MODEL_NAME}")
 
+def _genai():
+    """
+    Imports the Gemini SDK on first use. It pulls in gRPC, protobuf and the auth libraries, so code that
+    only imports this module (e.g. main.py rejecting bad arguments) doesn't pay for that.
+    """
+    import google.generativeai as genai
+    return genai
+
 class JournalGenerator:
     def __init__(self):
         """
         Initializes the journal generator with the Google Gemini API.
         """
         print(f"Initializing generator with Google Gemini API model: {MODEL_NAME}")
+        # Event loop generate_entries runs on, created on first use. The SDK builds its async gRPC client once per
+        # model and binds it to the loop of the first async call, so every later call must run on that same loop.
+        self._loop = None
         try:
             api_key = os.getenv("GOOGLE_API_KEY")
             if not api_key:
                 raise ValueError("GOOGLE_API_KEY environment variable not found. Please set it before running the script.")
+            genai = _genai()
             genai.configure(api_key=api_key)
             self.model = genai.GenerativeModel(MODEL_NAME)
             print(f"Gemini model {MODEL_NAME} initialized successfully.")
@@ -31,27 +47,33 @@ class JournalGenerator:
             print(f"Error initializing Google Gemini API: {e}")
             raise RuntimeError(f"Could not initialize Gemini model {MODEL_NAME}") from e
 
+    # Invariant prompt segments, built once rather than on every call
+    _PROMPT_RULES = "Generate only the journal entry text itself, without any introductory phrases like 'Here is a journal entry:' or similar. Do not include any titles or extra formatting beyond standard paragraph breaks if needed."
+    _EXAMPLES_HEADER = "\nHere are some examples of style and tone to guide you:"
+    _EXAMPLES_FOOTER = "\nBased on these examples, and keeping a similar style and tone, write the new journal entry:"
+    _NO_EXAMPLES_FOOTER = "\nWrite the new journal entry now, following all rules above:"
+
     def _construct_prompt_text(self, target_emotion: str, avg_word_count: int, example_entries: list[str] | None = None) -> str:
         """
         Constructs the prompt for the Gemini API.
         """
-        prompt_parts = []
-        prompt_parts.append(f"Write a journal entry that very much focuses on the tone/style preset: {target_emotion}.")
-        prompt_parts.append(f"The entry must be approximately {avg_word_count} words long.")
-        prompt_parts.append("Generate only the journal entry text itself, without any introductory phrases like 'Here is a journal entry:' or similar. Do not include any titles or extra formatting beyond standard paragraph breaks if needed.")
-
-        if example_entries:
-            prompt_parts.append("\nHere are some examples of style and tone to guide you:")
-            for i, ex in enumerate(example_entries):
-                # Basic cleaning, though Gemini is generally robust
-                temp_ex = ex.replace('"""', '"').replace("'''", "'")
-                # No complex escaping needed for Gemini prompt parts like for f-strings in local models
-                prompt_parts.append(f'\nExample {i+1}: "{temp_ex}"') 
-            prompt_parts.append("\nBased on these examples, and keeping a similar style and tone, write the new journal entry:")
-        else:
-            prompt_parts.append("\nWrite the new journal entry now, following all rules above:")
-        
-        return " ".join(prompt_parts)
+        head = (
+            f"Write a journal entry that very much focuses on the tone/style preset: {target_emotion}. "
+            f"The entry must be approximately {avg_word_count} words long. {self._PROMPT_RULES}"
+        )
+        if not example_entries:
+            return f"{head} {self._NO_EXAMPLES_FOOTER}"
+
+        # No complex escaping needed for Gemini prompt parts like for f-strings in local models
+        examples = " ".join(
+            f'\nExample {i}: "{self._clean_example(ex)}"' for i, ex in enumerate(example_entries, start=1)
+        )
+        return f"{head} {self._EXAMPLES_HEADER} {examples} {self._EXAMPLES_FOOTER}"
+
+    @staticmethod
+    def _clean_example(example: str) -> str:
+        """Basic cleaning of an example entry before quoting it, though Gemini is generally robust."""
+        return example.replace('"""', '"').replace("'''", "'")
 
     def generate_entry(
         self,
@@ -68,6 +90,134 @@ class JournalGenerator:
             print("Gemini model not initialized. Cannot generate entry.")
             return ""
 
+        prompt_text, generation_config = self._build_request(target_emotion, avg_word_count, example_entries, max_new_tokens)
+
+        try:
+            # For Gemini, the prompt is passed directly
+            response = self.model.generate_content(
+                prompt_text,
+                generation_config=generation_config,
+                # safety_settings=safety_settings 
+            )
+        except Exception as e:
+            print(f"Error during Gemini API call: {e}")
+            # Consider adding retries with backoff for transient network issues if this becomes common
+            return ""
+
+        return self._process_response(response, avg_word_count)
+
+    async def agenerate_entry(
+        self,
+        target_emotion: str,
+        avg_word_count: int,
+        example_entries: list[str] | None = None,
+        max_new_tokens: int = 0
+    ) -> str:
+        """
+        Async version of generate_entry, using the Gemini async API so several requests can be in flight at once.
+        Takes the same arguments and returns the same processed text ("" on failure).
+        """
+        if not self.model:
+            print("Gemini model not initialized. Cannot generate entry.")
+            return ""
+
+        prompt_text, generation_config = self._build_request(target_emotion, avg_word_count, example_entries, max_new_tokens)
+        return await self._agenerate_from_request(prompt_text, generation_config, avg_word_count)
+
+    async def _agenerate_from_request(
+        self,
+        prompt_text: str,
+        generation_config: "genai.types.GenerationConfig",
+        avg_word_count: int
+    ) -> str:
+        """Sends an already built request to the Gemini async API and processes the response ("" on failure)."""
+        try:
+            response = await self.model.generate_content_async(
+                prompt_text,
+                generation_config=generation_config,
+            )
+        except Exception as e:
+            print(f"Error during Gemini API call: {e}")
+            return ""
+
+        return self._process_response(response, avg_word_count)
+
+    def generate_entries(self, entry_requests: list[dict], max_concurrent: int = 4) -> list[str]:
+        """
+        Generates several journal entries concurrently. Each request spends most of its time waiting
+        on the network, so overlapping them scales throughput up to the API's rate limit.
+        This runs agenerate_entries on an event loop the generator keeps for its lifetime (see close()), so it
+        raises RuntimeError if called while an event loop is already running (e.g. in Jupyter or an async host);
+        await agenerate_entries there instead.
+
+        Args:
+            entry_requests (list[dict]): Keyword arguments for agenerate_entry, one dict per entry
+                (target_emotion, avg_word_count, and optionally example_entries / max_new_tokens).
+            max_concurrent (int): Maximum number of requests in flight at once.
+
+        Returns:
+            list[str]: The generated entries in request order ("" for any that failed).
+        """
+        if not self.model:
+            print("Gemini model not initialized. Cannot generate entry.")
+            return [""] * len(entry_requests)
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError: # No loop running in this thread, so ours can be driven here
+            pass
+        else:
+            raise RuntimeError("generate_entries cannot be called from a running event loop; await agenerate_entries instead.")
+
+        # Reuse one loop rather than asyncio.run per call: asyncio.run closes its loop on return, and the SDK's
+        # async client stays bound to it, so every call after the first would fail with "Event loop is closed"
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(self.agenerate_entries(entry_requests, max_concurrent))
+
+    def close(self) -> None:
+        """
+        Closes the event loop generate_entries runs on. The SDK's async client is bound to that loop,
+        so call this once the generator is no longer needed.
+        """
+        if self._loop is not None:
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
+            self._loop = None
+
+    async def agenerate_entries(self, entry_requests: list[dict], max_concurrent: int = 4) -> list[str]:
+        """
+        Async version of generate_entries, for callers that already run an event loop.
+        Takes the same arguments and returns the same list of entries in request order ("" for any that failed).
+        """
+        if not self.model:
+            print("Gemini model not initialized. Cannot generate entry.")
+            return [""] * len(entry_requests)
+
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def _generate_one(entry_request: dict) -> str:
+            # Build the prompt before queueing for a slot: requests waiting on the semaphore have theirs
+            # ready while earlier ones are in flight, and a slot is only held for the API call itself
+            prompt_text, generation_config = self._build_request(
+                entry_request["target_emotion"],
+                entry_request["avg_word_count"],
+                entry_request.get("example_entries"),
+                entry_request.get("max_new_tokens", 0)
+            )
+            async with semaphore:
+                return await self._agenerate_from_request(prompt_text, generation_config, entry_request["avg_word_count"])
+
+        return list(await asyncio.gather(*(_generate_one(entry_request) for entry_request in entry_requests)))
+
+    def _build_request(
+        self,
+        target_emotion: str,
+        avg_word_count: int,
+        example_entries: list[str] | None,
+        max_new_tokens: int
+    ) -> tuple[str, "genai.types.GenerationConfig"]:
+        """Builds the prompt text and generation config for one entry, and logs them."""
         prompt_text = self._construct_prompt_text(target_emotion, avg_word_count, example_entries)
         
         # Gemini uses generation_config for parameters like max_output_tokens, temperature, etc.
@@ -80,7 +230,7 @@ class JournalGenerator:
         else: # User provided a value, assume it's intended for max_output_tokens
             calculated_max_output_tokens = max_new_tokens
 
-        generation_config = genai.types.GenerationConfig(
+        generation_config = _genai().types.GenerationConfig(
             # candidate_count=1, # Default is 1
             # stop_sequences=[], # Can be used if needed
             max_output_tokens=calculated_max_output_tokens,
@@ -99,19 +249,15 @@ class JournalGenerator:
         print(prompt_text)
         print(f"(Generation Config: max_output_tokens={calculated_max_output_tokens}, temperature=0.7)")
         print("-----------------------------------")
+        return prompt_text, generation_config
 
+    def _process_response(self, response, avg_word_count: int) -> str:
+        """Extracts the text from a Gemini response, then cleans it and enforces the word count target."""
+        print("\n--- Received RESPONSE from Gemini API ---")
+        # print(response) # Full response object can be verbose
+        
         generated_text_raw = ""
         try:
-            # For Gemini, the prompt is passed directly
-            response = self.model.generate_content(
-                prompt_text,
-                generation_config=generation_config,
-                # safety_settings=safety_settings 
-            )
-            
-            print("\n--- Received RESPONSE from Gemini API ---")
-            # print(response) # Full response object can be verbose
-            
             # Accessing the text part:
             if response.parts:
                 generated_text_raw = response.text # .text directly gives the combined text
@@ -125,10 +271,8 @@ class JournalGenerator:
                     print(f"Warning: Unexpected Gemini API response format or empty response. Parts: {hasattr(response, 'parts')}, Candidates: {hasattr(response, 'candidates')}")
                 # print(f"Full response for debugging: {response}") # uncomment for deep debug
                 return ""
-
         except Exception as e:
-            print(f"Error during Gemini API call: {e}")
-            # Consider adding retries with backoff for transient network issues if this becomes common
+            print(f"Error reading Gemini API response: {e}")
             return ""
 
         # Gemini usually doesn't include the prompt or extra preambles if instructed not to.
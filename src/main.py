@@ -1,9 +1,18 @@
 import argparse
-import pandas as pd
+import asyncio
+import itertools
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
 import time
 import os
 from datetime import datetime, timedelta
-from dotenv import load_dotenv # Import load_dotenv
+try:
+    from dotenv import load_dotenv # Import load_dotenv
+except ImportError:
+    # python-dotenv is optional: without it, export GOOGLE_API_KEY in the shell instead of using a .env file
+    def load_dotenv(*args, **kwargs) -> bool:
+        return False
 
 # Load environment variables from .env file
 # This should be done as early as possible, especially before other modules might try to access them.
@@ -11,39 +20,193 @@ load_dotenv()
 
 # Try to import from local src package first
 if __package__:
-    from .data_loader import load_and_preprocess_data, get_examples_for_prompt, ALL_AVAILABLE_EMOTIONS
+    from .data_loader import load_and_preprocess_data, EmotionSampler, ALL_AVAILABLE_EMOTIONS
     from .generator import JournalGenerator
     from .exporter import JournalExporter
+    from .utils import count_words_batch, check_word_count_adherence_batch
     # from .utils import get_current_datetime_str # No longer needed for default start date
 else:
     # Allow running directly from src/ for simplified testing, assuming other files are in the same dir
-    from data_loader import load_and_preprocess_data, get_examples_for_prompt, ALL_AVAILABLE_EMOTIONS
+    from data_loader import load_and_preprocess_data, EmotionSampler, ALL_AVAILABLE_EMOTIONS
     from generator import JournalGenerator
     from exporter import JournalExporter
+    from utils import count_words_batch, check_word_count_adherence_batch
     # from utils import get_current_datetime_str # No longer needed for default start date
 
 DEFAULT_OUTPUT_DIR = "generated_entries"
+# Maximum number of generated batches waiting to be written before generation pauses for the disk
+MAX_PENDING_SAVES = 2
+# Runs of at least this many days format their dates with NumPy instead of per-day strftime
+VECTORIZED_DATES_MIN_DAYS = 32
+# Target word counts within this width share a batch, so short entries don't wait on much longer ones
+WORD_COUNT_BUCKET_WIDTH = 50
 
-def main():
+def parse_word_counts(value: str) -> list[int]:
+    """
+    Parses a comma-separated list of positive word counts, e.g. "50,100,200".
+
+    Raises:
+        argparse.ArgumentTypeError: If any item is not a positive integer.
+    """
+    try:
+        word_counts = [int(item) for item in value.split(",") if item.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated integers, got '{value}'")
+    if not word_counts or any(word_count <= 0 for word_count in word_counts):
+        raise argparse.ArgumentTypeError(f"expected positive word counts, got '{value}'")
+    return word_counts
+
+def non_negative_int(value: str) -> int:
+    """argparse type for counts where 0 is meaningful (e.g. 0 examples disables few-shot prompting) and for seeds."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected an integer, got '{value}'")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"expected a non-negative integer, got '{value}'")
+    return number
+
+def positive_int(value: str) -> int:
+    """argparse type for sizes that must be at least 1."""
+    number = non_negative_int(value)
+    if number == 0:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got '{value}'")
+    return number
+
+def parse_start_date(value: str) -> datetime:
+    """argparse type for --start_date: parses YYYYMMDD so a bad date fails at argument parsing."""
+    try:
+        return datetime.strptime(value, "%Y%m%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a date in YYYYMMDD format, got '{value}'")
+
+def format_day_dates(start_date: datetime, num_days: int) -> list[str]:
+    """
+    Returns the YYYYMMDD strings for num_days consecutive days starting at start_date.
+    Long runs offset and format every date in one NumPy datetime64 operation instead of one timedelta
+    and strftime per day; short runs (under VECTORIZED_DATES_MIN_DAYS) aren't worth the array setup.
+    """
+    if num_days < VECTORIZED_DATES_MIN_DAYS:
+        return [(start_date + timedelta(days=day_num)).strftime("%Y%m%d") for day_num in range(num_days)]
+
+    dates = np.datetime64(start_date.date(), 'D') + np.arange(num_days, dtype='timedelta64[D]')
+    return [date_str.replace("-", "") for date_str in np.datetime_as_string(dates, unit='D')]
+
+def batch_by_word_count(planned_entries: list[tuple], batch_size: int, bucket_width: int = WORD_COUNT_BUCKET_WIDTH) -> list[list[tuple]]:
+    """
+    Groups planned entries into batches of at most batch_size whose target word counts fall in the same bucket.
+    A batch finishes only when its longest entry does, so mixing short and long targets wastes the short ones' slots.
+
+    Args:
+        planned_entries (list[tuple]): (day_num, entry_num_in_day, date_str, entry_request) tuples.
+        batch_size (int): Maximum number of entries per batch.
+        bucket_width (int): Width, in words, of each word count bucket.
+
+    Returns:
+        list[list[tuple]]: The batches, shortest bucket first; entries keep their planned order within a bucket.
+    """
+    def bucket_of(planned_entry: tuple) -> int:
+        return round(planned_entry[3]["avg_word_count"] / bucket_width)
+
+    batches = []
+    for _, bucket_entries in itertools.groupby(sorted(planned_entries, key=bucket_of), key=bucket_of):
+        bucket_entries = list(bucket_entries)
+        batches.extend(bucket_entries[start:start + batch_size] for start in range(0, len(bucket_entries), batch_size))
+    return batches
+
+async def _count_saved(save_future: Future) -> int:
+    """Waits, without blocking the event loop, for a save_entries call to finish and returns how many of its entries were written."""
+    return sum(1 for saved_file in await asyncio.wrap_future(save_future) if saved_file)
+
+async def _generate_and_save(generator: JournalGenerator, exporter: JournalExporter, planned_entries: list[tuple],
+                             batch_size: int, durable: bool) -> int:
+    """
+    Generates the planned entries batch by batch and saves each batch on a background thread.
+    Every batch is awaited on this one event loop: the Gemini SDK's async client is bound to the loop it
+    first ran on, so running each batch on its own loop (asyncio.run per batch) fails every batch after the first.
+
+    Args:
+        generator (JournalGenerator): Generates each batch via agenerate_entries.
+        exporter (JournalExporter): Saves each batch via save_entries.
+        planned_entries (list[tuple]): (day_num, entry_num_in_day, date_str, entry_request) tuples.
+        batch_size (int): Maximum number of entries per batch, and of requests in flight at once.
+        durable (bool): Whether save_entries should fsync each saved batch.
+
+    Returns:
+        int: The number of entries saved.
+    """
+    total_entries_generated = 0
+    entries_dispatched = 0
+    pending_saves = deque() # Futures of save_entries calls still being written, oldest first
+    # A single saver thread writes batches in submission order, so file sequence numbers stay in generation order
+    with ThreadPoolExecutor(max_workers=1) as save_executor:
+        for batch in batch_by_word_count(planned_entries, batch_size):
+            print(f"\n-- Generating entries {entries_dispatched + 1}-{entries_dispatched + len(batch)} of {len(planned_entries)} "
+                  f"(~{batch[0][3]['avg_word_count']} words) --")
+            entries_dispatched += len(batch)
+
+            start_time = time.time()
+            generated_texts = await generator.agenerate_entries(
+                [entry_request for _, _, _, entry_request in batch],
+                max_concurrent=batch_size
+            )
+            end_time = time.time()
+            print(f"LLM Generation time: {end_time - start_time:.2f} seconds for {len(batch)} entries.")
+
+            for (day_num, entry_num_in_day, _, _), generated_text in zip(batch, generated_texts):
+                if not generated_text:
+                    print(f"Failed to generate entry {entry_num_in_day} for day {day_num + 1}. Skipping.")
+
+            # Validate the whole batch's lengths at once; failed (empty) entries were already reported above
+            is_adherent, _ = check_word_count_adherence_batch(
+                count_words_batch(generated_texts),
+                np.array([entry_request["avg_word_count"] for _, _, _, entry_request in batch])
+            )
+            off_target = [batch[index] for index in np.flatnonzero(~is_adherent) if generated_texts[index]]
+            if off_target:
+                print(f"Warning: {len(off_target)} of {len(batch)} entries in this batch are outside the word count tolerance: "
+                      + ", ".join(f"day {day_num + 1} entry {entry_num_in_day}" for day_num, entry_num_in_day, _, _ in off_target))
+
+            # Write this batch on the saver thread while the next batch is generating. Waiting on the oldest
+            # save once MAX_PENDING_SAVES are queued keeps memory bounded if the disk falls behind.
+            if len(pending_saves) >= MAX_PENDING_SAVES:
+                total_entries_generated += await _count_saved(pending_saves.popleft())
+            pending_saves.append(save_executor.submit(
+                exporter.save_entries, [generated_text for generated_text in generated_texts if generated_text],
+                durable=durable
+            ))
+
+        while pending_saves:
+            total_entries_generated += await _count_saved(pending_saves.popleft())
+    return total_entries_generated
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """Builds the command-line parser for the generation script."""
     parser = argparse.ArgumentParser(description="Generate synthetic journal entries.")
     parser.add_argument(
         "--num_days", 
-        type=int, 
+        type=non_negative_int, 
         default=1, # Made optional, default to 1 day
         help="Number of days to generate entries for (default: 1)."
     )
     parser.add_argument(
         "--entries_per_day", 
-        type=int, 
+        type=non_negative_int, 
         default=1, 
         help="Number of entries to generate per day (default: 1)."
     )
     parser.add_argument(
         "--avg_word_count", 
-        type=int, 
+        type=positive_int, 
         default=100, 
         help="Desired average word count for entries (default: 100)."
     )
+    parser.add_argument(
+        "--avg_word_counts",
+        type=parse_word_counts,
+        default=None,
+        help="Comma-separated word counts (e.g. 50,100,200) cycled across entries instead of a single --avg_word_count."
+    )
     parser.add_argument(
         "--tone", 
         type=str, 
@@ -59,37 +222,69 @@ def main():
     )
     parser.add_argument(
         "--num_examples_prompt", 
-        type=int, 
+        type=non_negative_int, 
         default=3, 
         help="Number of example entries from the dataset to use in the few-shot prompt. Set to 0 to disable. (default: 3)."
     )
     parser.add_argument(
         "--max_generation_tokens",
-        type=int,
+        type=non_negative_int,
         default=0, # Default to 0, let generator calculate based on avg_word_count
         help="Maximum number of new tokens the LLM should generate. Default 0 lets the generator estimate based on avg_word_count."
     )
     parser.add_argument(
         "--start_date",
-        type=str,
+        type=parse_start_date,
         default=None, 
         help="Start date for journal entries in YYYYMMDD format. Defaults to today."
     )
+    parser.add_argument(
+        "--max_batch_size",
+        type=positive_int,
+        default=8,
+        help="Maximum number of entries requested from the LLM at once; larger runs are split into batches of this size (default: 8)."
+    )
+    parser.add_argument(
+        "--durable_writes",
+        action="store_true",
+        help="Flush each batch of saved entries to disk (fsync) before counting it as saved. Slower, but survives crashes."
+    )
+    parser.add_argument(
+        "--seed",
+        type=non_negative_int, # np.random.default_rng rejects negative seeds
+        default=None,
+        help="Seed for picking few-shot examples. The same seed, data and arguments choose the same examples on every run. Defaults to a random seed."
+    )
+
+    return parser
+
+def main(args: argparse.Namespace | None = None):
+    """
+    Runs the generation script.
 
-    args = parser.parse_args()
+    Args:
+        args (argparse.Namespace | None): Already parsed arguments (e.g. from build_arg_parser()).
+            If None, they are parsed from the command line.
+    """
+    if args is None:
+        args = build_arg_parser().parse_args()
 
     print("--- Journal Generation Script Initializing ---")
     print(f"Configuration:\n{args}")
 
     journal_df = None
+    example_sampler = None
     if args.num_examples_prompt > 0:
         print("\n--- Loading and Preprocessing Seed Data for Examples ---")
         try:
             journal_df = load_and_preprocess_data()
+            # Index emotion rows once so each entry's example lookup doesn't rescan the dataset
+            example_sampler = EmotionSampler(journal_df, rng=np.random.default_rng(args.seed))
             print("Seed data loaded successfully.")
         except Exception as e:
             print(f"Error loading seed data: {e}. Few-shot prompting with dataset examples will be disabled.")
             journal_df = None 
+            example_sampler = None
     else:
         print("\n--- Skipping seed data loading as num_examples_prompt is 0. ---")
 
@@ -104,43 +299,39 @@ def main():
         return
 
     print("\n--- Starting Journal Entry Generation ---")
-    total_entries_generated = 0
-    # Use datetime.now().strftime("%Y%m%d") directly for default start date if not provided
-    current_date_obj = datetime.strptime(args.start_date, "%Y%m%d") if args.start_date else datetime.now()
+    # --start_date is already parsed by argparse; default to today if not provided
+    current_date_obj = args.start_date or datetime.now()
+    # Format each day's date once; every entry of that day shares it
+    date_strs = format_day_dates(current_date_obj, args.num_days)
 
-    for day_num in range(args.num_days):
-        date_str = (current_date_obj + timedelta(days=day_num)).strftime("%Y%m%d")
+    # Plan every entry up front so the LLM calls can be issued in batches instead of one at a time
+    planned_entries = [] # (day_num, entry_num_in_day, date_str, entry_request)
+    word_counts = itertools.cycle(args.avg_word_counts or [args.avg_word_count])
+    for day_num, date_str in enumerate(date_strs):
         print(f"\n== Day {day_num + 1} of {args.num_days} (Date: {date_str}) ==")
         
         for entry_num_in_day in range(1, args.entries_per_day + 1):
-            print(f"-- Generating entry {entry_num_in_day} of {args.entries_per_day} for date {date_str}, tone: '{args.tone}' --")
+            print(f"-- Preparing entry {entry_num_in_day} of {args.entries_per_day} for date {date_str}, tone: '{args.tone}' --")
             
             example_entries_for_prompt = [] # Initialize for each entry
-            if journal_df is not None and args.num_examples_prompt > 0:
+            if example_sampler is not None and args.num_examples_prompt > 0:
                 # Fetch new examples for EACH entry to promote diversity
                 print(f"Fetching {args.num_examples_prompt} examples for tone: '{args.tone}'")
-                example_entries_for_prompt = get_examples_for_prompt(journal_df, args.tone, args.num_examples_prompt)
+                example_entries_for_prompt = example_sampler.sample(args.tone, args.num_examples_prompt)
                 if not example_entries_for_prompt:
                     print(f"Warning: Could not fetch examples for tone '{args.tone}'. Proceeding without few-shot examples for this specific entry.")
             
-            start_time = time.time()
-            generated_text = generator.generate_entry(
-                target_emotion=args.tone,
-                avg_word_count=args.avg_word_count,
-                example_entries=example_entries_for_prompt, # Pass potentially new examples
-                max_new_tokens=args.max_generation_tokens
-            )
-            end_time = time.time()
-            print(f"LLM Generation time: {end_time - start_time:.2f} seconds.")
-
-            if generated_text:
-                saved_file = exporter.save_entry(
-                    entry_text=generated_text
-                )
-                if saved_file:
-                    total_entries_generated += 1
-            else:
-                print(f"Failed to generate entry {entry_num_in_day} for day {day_num + 1}. Skipping.")
+            planned_entries.append((day_num, entry_num_in_day, date_str, {
+                "target_emotion": args.tone,
+                "avg_word_count": next(word_counts),
+                "example_entries": example_entries_for_prompt, # Pass potentially new examples
+                "max_new_tokens": args.max_generation_tokens
+            }))
+
+    # One event loop for the whole run, shared by every batch (see _generate_and_save)
+    total_entries_generated = asyncio.run(_generate_and_save(
+        generator, exporter, planned_entries, args.max_batch_size, args.durable_writes
+    ))
 
     print("\n--- Journal Generation Complete ---")
     print(f"Total entries generated: {total_entries_generated}")
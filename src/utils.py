@@ -1,6 +1,12 @@
 import datetime
 import re
-from nltk.tokenize import word_tokenize, sent_tokenize
+from typing import Callable
+import numpy as np
+
+# Labels a model may echo at the very start of its output instead of going straight into the entry
+_PROMPT_PREFIX_RE = re.compile(r"^\s*(?:New Journal Entry|Journal Entry|Entry|Here is a journal entry)\s*:\s*", re.IGNORECASE)
+# A "word" for truncation is any run of non-whitespace, the same definition count_words uses
+_WORD_RE = re.compile(r"\S+")
 
 # def get_current_datetime_str(format_str="%Y%m%d") -> str:
 #     """Returns the current date as a string, formatted as YYYYMMDD."""
@@ -20,22 +26,27 @@ def construct_filename(unique_id_str: str, prefix: str = "journal") -> str:
     """Constructs the filename using a unique ID string, e.g., journal_YYYYMMDD_HHMMSSffffff.txt."""
     return f"{prefix}_{unique_id_str}.txt"
 
+def make_filename_factory(prefix: str = "journal") -> Callable[[str], str]:
+    """
+    Returns a function equivalent to construct_filename with a fixed prefix. The "prefix_" head is
+    built once, so callers naming many files only concatenate the unique ID per call.
+    """
+    head = f"{prefix}_"
+    return lambda unique_id_str: head + unique_id_str + ".txt"
+
 def clean_generated_text(text: str) -> str:
     """
     Basic cleaning of LLM generated text.
-    - Removes text that might be part of the prompt/instruction included in the output.
+    - Removes a leading label the model sometimes echoes from the prompt (e.g. "New Journal Entry:").
     - Strips leading/trailing whitespace.
     """
-    # Models sometimes repeat the prompt or instructions. 
-    # This is a common pattern for some models if they include the input in the output.
-    # For Sarvam-M, the response is typically in a structured format where generated_text is separate.
-    # However, if the raw output of a text-generation pipeline for other models includes the prompt,
-    # this might be useful. For now, we assume the `generator.py` handles extracting only the new text.
-    
-    # A more generic cleaner might look for phrases like "New Journal Entry:" if they accidentally get included.
-    # For now, just strip whitespace.
-    text = text.strip()
-    return text
+    return clean_generated_text_batch([text])[0]
+
+def clean_generated_text_batch(texts: list[str]) -> list[str]:
+    """Cleans several generated texts the same way as clean_generated_text, in one pass."""
+    # Models sometimes repeat the prompt or instructions, e.g. by opening with the label the prompt used.
+    # The generator already extracts only the new text, so only a leading label needs removing.
+    return [_PROMPT_PREFIX_RE.sub("", text).strip() for text in texts]
 
 def count_words(text: str) -> int:
     """Counts the number of words in a text by splitting on whitespace."""
@@ -46,6 +57,8 @@ def count_words(text: str) -> int:
 def check_word_count_adherence(text_word_count: int, target_word_count: int, tolerance_percentage: float = 0.50) -> tuple[bool, float]:
     """
     Checks if the actual word count is within a tolerance percentage of the target word count.
+    The tolerance is inclusive and judged on the deviation itself (|deviation| <= tol), so a count exactly tol away
+    from the target is adherent (e.g. 115 words for a target of 100 at 0.15), even where target*(1+tol) rounds below it.
 
     Args:
         text_word_count (int): The actual word count of the generated text.
@@ -60,11 +73,37 @@ def check_word_count_adherence(text_word_count: int, target_word_count: int, tol
     if target_word_count == 0: # Avoid division by zero if target is 0 for some reason
         return text_word_count == 0, 0.0
 
-    lower_bound = target_word_count * (1 - tolerance_percentage)
-    upper_bound = target_word_count * (1 + tolerance_percentage)
-    
-    is_adherent = lower_bound <= text_word_count <= upper_bound
     deviation = (text_word_count - target_word_count) / target_word_count
+    return abs(deviation) <= tolerance_percentage, deviation
+
+def count_words_batch(texts: list[str]) -> np.ndarray:
+    """Counts the whitespace-separated words of each text, like count_words, returning an int32 array."""
+    return np.fromiter((len(text.split()) if text else 0 for text in texts), dtype=np.int32, count=len(texts))
+
+def check_word_count_adherence_batch(
+    text_word_counts: np.ndarray,
+    target_word_count: int | np.ndarray,
+    tolerance_percentage: float = 0.50
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized check_word_count_adherence over many word counts at once.
+
+    Args:
+        text_word_counts (np.ndarray): The actual word counts, e.g. from count_words_batch.
+        target_word_count (int | np.ndarray): The desired word count, either shared or one per entry.
+        tolerance_percentage (float): The allowable deviation (e.g., 0.50 for 50%).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (is_adherent, deviation_percentage) as boolean and float arrays,
+                                      with the same conventions as check_word_count_adherence.
+    """
+    counts = np.asarray(text_word_counts, dtype=np.float64)
+    targets = np.broadcast_to(np.asarray(target_word_count, dtype=np.float64), counts.shape)
+
+    has_target = targets != 0 # A target of 0 only accepts an empty text, as in the scalar version
+
+    deviation = np.divide(counts - targets, targets, out=np.zeros_like(counts), where=has_target)
+    is_adherent = np.where(has_target, np.abs(deviation) <= tolerance_percentage, counts == 0)
     return is_adherent, deviation
 
 def smart_truncate_text(text: str, target_word_count: int, max_overshoot_words: int = 30) -> str:
@@ -82,7 +121,7 @@ def smart_truncate_text(text: str, target_word_count: int, max_overshoot_words:
     Returns:
         str: The potentially truncated text.
     """
-    words = word_tokenize(text)
+    words = _WORD_RE.findall(text)
     current_word_count = len(words)
 
     if current_word_count <= target_word_count + max_overshoot_words:
@@ -92,12 +131,7 @@ def smart_truncate_text(text: str, target_word_count: int, max_overshoot_words:
     # More advanced: could look for last sentence end before target_word_count + small_buffer
     # For now, we'll just cut to the target word count if it's too long.
     truncated_words = words[:target_word_count]
-    # Re-join carefully, especially with punctuation that word_tokenize might separate.
-    # A simple join might not be perfect for all tokenized outputs.
-    # Using nltk.tokenize.treebank.TreebankWordDetokenizer would be more robust but adds dependency/complexity.
-    # For now, a simple join is often good enough.
-    # However, NLTK's `word_tokenize` often splits contractions and punctuation. `detokenize` is better.
-    # Since we don't have it here, a simple join. User should be aware of potential minor spacing issues.
+    # Punctuation stays attached to its word, so a plain join only normalizes the whitespace between words.
     return " ".join(truncated_words).strip() # Basic rejoining
 
 if __name__ == '__main__':
@@ -121,8 +155,7 @@ if __name__ == '__main__':
     print(f"Cleaned text: '{cleaned}'")
 
     long_text = "This is a very long journal entry that needs to be truncated. It has many words, far more than we actually want for this particular example. We will see how the truncation function handles this situation. Hopefully, it does a reasonable job. We are aiming for about 20 words. This sentence makes it much longer."
-    word_tokens = word_tokenize(long_text)
-    print(f"Original word count for long_text: {len(word_tokens)}")
+    print(f"Original word count for long_text: {count_words(long_text)}")
     
     # Test check_word_count_adherence
     print("\n--- Testing Word Count Adherence ---")
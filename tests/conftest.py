@@ -0,0 +1,39 @@
+# tests/conftest.py
+import os
+import socket
+import sys
+
+import pytest
+
+# Make the modules in src/ importable as top-level modules (from data_loader import ...) for every test file
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+# Loopback stays reachable: asyncio's self-pipe can use a local socket pair on some platforms
+_LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+@pytest.fixture(autouse=True, scope="session")
+def _no_network():
+    """
+    Fails any test that opens a non-loopback connection, so a test that loses its Gemini mock errors out
+    immediately instead of hanging on the real API. This guards Python-level sockets (HTTP/REST clients);
+    gRPC's C core opens its own sockets and is kept out by mocking genai.GenerativeModel.
+    """
+    real_connect, real_connect_ex = socket.socket.connect, socket.socket.connect_ex
+
+    def _check(address):
+        if isinstance(address, tuple) and address[0] not in _LOOPBACK_HOSTS:
+            raise RuntimeError(f"Network access is blocked in tests (tried to connect to {address!r}).")
+
+    def guarded_connect(sock, address):
+        _check(address)
+        return real_connect(sock, address)
+
+    def guarded_connect_ex(sock, address):
+        _check(address)
+        return real_connect_ex(sock, address)
+
+    socket.socket.connect, socket.socket.connect_ex = guarded_connect, guarded_connect_ex
+    yield
+    socket.socket.connect, socket.socket.connect_ex = real_connect, real_connect_ex
@@ -1,23 +1,29 @@
 import unittest
 from unittest.mock import patch, mock_open, MagicMock
 import pandas as pd
+import numpy as np
 import os
-import sys
+import tempfile
 
-# Add src to Python path
-SRC_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src')
-if SRC_PATH not in sys.path:
-    sys.path.append(SRC_PATH)
-
-# It's crucial that this import happens *after* sys.path is potentially modified,
-# and that data_loader.py itself doesn't try to load data at import time in a way
+# src/ is put on sys.path by tests/conftest.py. data_loader.py itself must not load data at import time in a way
 # that would break tests if the real data file isn't there.
-from data_loader import load_and_preprocess_data, get_examples_for_prompt, ALL_AVAILABLE_EMOTIONS, EMOTION_COLUMNS, LOCAL_DATA_FILE
+from data_loader import load_and_preprocess_data, EmotionSampler, build_emotion_index, build_emotion_bitmask, find_rows_with_emotions, get_examples_for_prompt, ALL_AVAILABLE_EMOTIONS, EMOTION_COLUMNS, LOCAL_DATA_FILE
+from data_loader import EMOTION_BITS, TONE_TO_COLUMN, CSV_READ_OPTIONS, PYARROW_AVAILABLE, _load_and_preprocess_file, _columns_to_read
 
 class TestDataLoader(unittest.TestCase):
 
+    def setUp(self):
+        """Disable the Parquet dataset cache so tests never read or overwrite the real one."""
+        cache_patcher = patch('data_loader.DATA_CACHE_FILE', None)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+        # Each test mocks its own CSV contents, so don't reuse another test's memoized load
+        _load_and_preprocess_file.cache_clear()
+        self.addCleanup(_load_and_preprocess_file.cache_clear)
+
     def _create_sample_df(self, data_dict=None):
-        """Helper to create a sample DataFrame for testing."""
+        """Helper to create a sample DataFrame for testing. Returns a new DataFrame on every call,
+        so tests can hand it to code that modifies it in place without copying it first."""
         if data_dict is None:
             data_dict = {
                 'Answer': ["Entry 1", "Entry 2", "Entry 3", "Entry 4", "Entry 5"],
@@ -28,18 +34,28 @@ class TestDataLoader(unittest.TestCase):
             }
         return pd.DataFrame(data_dict)
 
+    def _patch_csv_file_probes(self):
+        """For tests that mock read_csv: stub the header peek and size check too, so nothing opens the real CSV."""
+        for patcher in (patch('data_loader._columns_to_read', return_value=None), # None: read every column
+                        patch('data_loader.os.path.getsize', return_value=1024)): # Small file: single read
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch('data_loader.os.path.getsize', return_value=1024) # Small file: single read, never touches the real CSV
+    @patch('data_loader._columns_to_read')
     @patch('data_loader.pd.read_csv')
     @patch('data_loader.os.path.exists')
-    def test_load_and_preprocess_data_success(self, mock_exists, mock_read_csv):
+    def test_load_and_preprocess_data_success(self, mock_exists, mock_read_csv, mock_columns_to_read, mock_getsize):
         """Test successful loading and preprocessing of data."""
         mock_exists.return_value = True
-        sample_df = self._create_sample_df()
-        mock_read_csv.return_value = sample_df.copy() # Use a copy
+        mock_columns_to_read.return_value = ['Answer', 'Answer.f1.happy.raw']
+        mock_read_csv.return_value = self._create_sample_df()
 
         df = load_and_preprocess_data()
 
         mock_exists.assert_called_once_with(LOCAL_DATA_FILE)
-        mock_read_csv.assert_called_once_with(LOCAL_DATA_FILE)
+        mock_columns_to_read.assert_called_once_with(LOCAL_DATA_FILE)
+        mock_read_csv.assert_called_once_with(LOCAL_DATA_FILE, usecols=['Answer', 'Answer.f1.happy.raw'], **CSV_READ_OPTIONS)
         self.assertIsInstance(df, pd.DataFrame)
         self.assertFalse(df.empty)
         self.assertIn('Answer', df.columns)
@@ -61,6 +77,7 @@ class TestDataLoader(unittest.TestCase):
         # Test Answer column stripping (if applicable, though not explicitly in current data_loader)
         # For now, just check it's string
         self.assertTrue(all(isinstance(x, str) for x in df['Answer']))
+        self.assertIsInstance(df['Answer'].dtype, pd.StringDtype)
 
 
     @patch('data_loader.os.path.exists')
@@ -76,6 +93,7 @@ class TestDataLoader(unittest.TestCase):
     def test_load_and_preprocess_data_missing_answer_column(self, mock_exists, mock_read_csv):
         """Test KeyError if 'Answer' column is missing."""
         mock_exists.return_value = True
+        self._patch_csv_file_probes()
         # Create a DataFrame without the 'Answer' column
         bad_data = {
             'Answer.f1.happy.raw': ['TRUE', 'FALSE'],
@@ -90,14 +108,14 @@ class TestDataLoader(unittest.TestCase):
     def test_load_and_preprocess_data_handles_missing_emotion_cols(self, mock_exists, mock_read_csv):
         """Test that missing emotion columns are handled gracefully (warning printed)."""
         mock_exists.return_value = True
+        self._patch_csv_file_probes()
         # Create a DataFrame with only 'Answer' and one emotion column
         partial_data = {
             'Answer': ["Entry 1", "Entry 2"],
             'Answer.f1.happy.raw': ['TRUE', 'FALSE'],
             # Other EMOTION_COLUMNS are missing
         }
-        mock_df = pd.DataFrame(partial_data)
-        mock_read_csv.return_value = mock_df.copy()
+        mock_read_csv.return_value = pd.DataFrame(partial_data)
 
         # Patch print to capture warnings
         with patch('builtins.print') as mock_print:
@@ -173,6 +191,241 @@ class TestDataLoader(unittest.TestCase):
         self.assertTrue(any("Warning: Emotion column for 'nonexistentemotion' (Answer.f1.nonexistentemotion.raw) not found" 
                             in call_args.args[0] for call_args in mock_print.call_args_list))
 
+    def test_columns_to_read_skips_unused_columns(self):
+        """Test that only 'Answer' and emotion columns present in the header are selected for parsing."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, "data.csv")
+            with open(csv_path, 'w', encoding='utf-8') as f:
+                f.write("Answer.t1.work.raw,Answer,Answer.f1.sad.raw,Answer.f1.happy.raw\nFALSE,Entry,TRUE,FALSE\n")
+            self.assertEqual(_columns_to_read(csv_path), ['Answer', 'Answer.f1.sad.raw', 'Answer.f1.happy.raw'])
+
+    def test_csv_read_options_type_columns_at_parse_time(self):
+        """Test that the parser itself types the columns, so clean data skips the Python-level fallback."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, "data.csv")
+            with open(csv_path, 'w', encoding='utf-8') as f:
+                f.write("Answer,Answer.f1.happy.raw,Answer.f1.sad.raw\n007,TRUE,FALSE\nSecond,false,True\n")
+            df = pd.read_csv(csv_path, **CSV_READ_OPTIONS)
+
+        self.assertIsInstance(df['Answer'].dtype, pd.StringDtype)
+        self.assertTrue(pd.api.types.is_bool_dtype(df['Answer.f1.happy.raw']))
+        self.assertEqual(df['Answer.f1.happy.raw'].tolist(), [True, False])
+        self.assertEqual(df['Answer.f1.sad.raw'].tolist(), [False, True])
+
+    @patch('data_loader.pd.read_csv')
+    @patch('data_loader.os.path.exists')
+    def test_load_and_preprocess_data_memoized_within_process(self, mock_exists, mock_read_csv):
+        """Test that repeat loads of an unchanged CSV reuse the first parse."""
+        mock_exists.return_value = True
+        self._patch_csv_file_probes()
+        mock_read_csv.return_value = self._create_sample_df()
+
+        first_df = load_and_preprocess_data()
+        second_df = load_and_preprocess_data()
+
+        mock_read_csv.assert_called_once()
+        self.assertIs(second_df, first_df)
+
+    def test_load_and_preprocess_data_reads_large_files_in_chunks(self):
+        """Test that a CSV over the size threshold is parsed in chunks with each chunk's emotions decoded."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, "data.csv")
+            with open(csv_path, 'w', encoding='utf-8') as f:
+                # Missing labels in the sad column keep the parser from decoding it, so the fallback runs per chunk
+                f.write("Answer,Answer.f1.happy.raw,Answer.f1.sad.raw\nOne,TRUE,\nTwo,FALSE,true\nThree,TRUE,NAN\n")
+
+            with patch('data_loader.LOCAL_DATA_FILE', csv_path), \
+                 patch('data_loader.CHUNKED_READ_MIN_BYTES', 0), \
+                 patch('data_loader.CSV_CHUNK_ROWS', 2), \
+                 patch('builtins.print'):
+                df = load_and_preprocess_data()
+
+        self.assertEqual(df['Answer'].tolist(), ["One", "Two", "Three"])
+        self.assertEqual(df.index.tolist(), [0, 1, 2])
+        self.assertEqual(df['Answer.f1.happy.raw'].tolist(), [True, False, True])
+        self.assertEqual(df['Answer.f1.sad.raw'].tolist(), [False, True, False])
+        self.assertTrue(pd.api.types.is_bool_dtype(df['Answer.f1.sad.raw']))
+
+    @unittest.skipUnless(PYARROW_AVAILABLE, "pyarrow is required for the Parquet dataset cache")
+    def test_load_and_preprocess_data_uses_parquet_cache(self):
+        """Test that a second load reads the Parquet cache instead of re-parsing the CSV."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, "data.csv")
+            cache_path = os.path.join(tmp_dir, "_data_cache.parquet")
+            with open(csv_path, 'w', encoding='utf-8') as f:
+                f.write("Answer,Answer.f1.happy.raw\n Happy Day ,TRUE\nSad Story,FALSE\n")
+
+            with patch('data_loader.LOCAL_DATA_FILE', csv_path), patch('data_loader.DATA_CACHE_FILE', cache_path):
+                first_df = load_and_preprocess_data()
+                self.assertTrue(os.path.exists(cache_path), "Preprocessed data should be cached.")
+                _load_and_preprocess_file.cache_clear() # Simulate a new run
+                with patch('data_loader.pd.read_csv') as mock_read_csv:
+                    cached_df = load_and_preprocess_data()
+                mock_read_csv.assert_not_called()
+
+        pd.testing.assert_frame_equal(cached_df, first_df)
+        self.assertEqual(cached_df['Answer'].tolist(), ["Happy Day", "Sad Story"])
+        self.assertTrue(pd.api.types.is_bool_dtype(cached_df['Answer.f1.happy.raw']))
+
+    @unittest.skipUnless(PYARROW_AVAILABLE, "pyarrow is required for the Parquet dataset cache")
+    def test_failed_cache_write_leaves_no_cache_file(self):
+        """Test that an interrupted cache write leaves neither a partial cache nor its temporary file behind."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, "data.csv")
+            cache_path = os.path.join(tmp_dir, "_data_cache.parquet")
+            with open(csv_path, 'w', encoding='utf-8') as f:
+                f.write("Answer,Answer.f1.happy.raw\nHappy Day,TRUE\n")
+
+            def failing_to_parquet(df, path, **kwargs):
+                with open(path, 'wb') as partial:
+                    partial.write(b"PAR1") # Simulate a write that dies partway through
+                raise OSError("disk full")
+
+            with patch('data_loader.LOCAL_DATA_FILE', csv_path), patch('data_loader.DATA_CACHE_FILE', cache_path), \
+                 patch.object(pd.DataFrame, 'to_parquet', failing_to_parquet), patch('builtins.print') as mock_print:
+                df = load_and_preprocess_data()
+
+            self.assertEqual(df['Answer'].tolist(), ["Happy Day"])
+            self.assertEqual(os.listdir(tmp_dir), ["data.csv"])
+            self.assertTrue(any("Warning: Could not write dataset cache" in call_args.args[0]
+                                for call_args in mock_print.call_args_list))
+
+    def test_build_emotion_index(self):
+        """Test that the index maps each present emotion to its matching row positions."""
+        sample_df = self._create_sample_df({
+            'Answer': ["Happy Day", "Sad Story", "Sunny Entry"],
+            'Answer.f1.happy.raw': [True, False, True],
+            'Answer.f1.sad.raw': [False, True, False]
+        })
+        index = build_emotion_index(sample_df)
+        self.assertEqual(set(index.keys()), {'happy', 'sad'}) # Only emotions with a column are indexed
+        self.assertEqual(index['happy'].tolist(), [0, 2])
+        self.assertEqual(index['sad'].tolist(), [1])
+
+    def test_emotion_sampler_samples_matching_entries(self):
+        """Test that EmotionSampler draws only entries labelled with the requested emotion."""
+        sample_df = self._create_sample_df({
+            'Answer': ["Happy Day", "Joyful Times", "Sad Story", "Sunny Entry"],
+            'Answer.f1.happy.raw': [True, True, False, True],
+            'Answer.f1.sad.raw': [False, False, True, False]
+        })
+        sampler = EmotionSampler(sample_df)
+
+        examples = sampler.sample('Happy', num_examples=2)
+        self.assertEqual(len(examples), 2)
+        self.assertEqual(len(set(examples)), 2, "Examples should be drawn without replacement.")
+        for ex in examples:
+            self.assertIn(ex, ["Happy Day", "Joyful Times", "Sunny Entry"])
+        self.assertEqual(sampler.sample('sad', num_examples=3), ["Sad Story"]) # Fewer than requested: all found
+        self.assertEqual(sampler.sample('happy', num_examples=0), [])
+
+    def test_emotion_sampler_caches_example_pool(self):
+        """Test that an emotion's example pool is built once and reused by later draws."""
+        sample_df = self._create_sample_df({
+            'Answer': ["Happy Day", "Sad Story", "Sunny Entry"],
+            'Answer.f1.happy.raw': [True, False, True]
+        })
+        sampler = EmotionSampler(sample_df)
+
+        pool = sampler.example_pool('HAPPY')
+        self.assertEqual(pool.tolist(), ["Happy Day", "Sunny Entry"])
+        self.assertIs(sampler.example_pool('happy'), pool)
+        self.assertIsNone(sampler.example_pool('sad'))
+        sample_df['Answer'] = "Changed after the pool was built"
+        self.assertIn(sampler.sample('happy', num_examples=1)[0], ["Happy Day", "Sunny Entry"])
+
+    def test_emotion_sampler_sample_all(self):
+        """Test that sample_all only draws entries labelled with every requested emotion."""
+        sample_df = self._create_sample_df({
+            'Answer': ["Happy Day", "Sad Story", "Bittersweet", "Nothing"],
+            'Answer.f1.happy.raw': [True, False, True, False],
+            'Answer.f1.sad.raw': [False, True, True, False]
+        })
+        sampler = EmotionSampler(sample_df)
+
+        with patch('builtins.print'):
+            self.assertEqual(sampler.sample_all(['Happy', 'sad'], num_examples=2), ["Bittersweet"])
+        self.assertEqual(sorted(sampler.sample_all(['happy'], num_examples=2)), ["Bittersweet", "Happy Day"])
+        self.assertEqual(sampler.sample_all(['happy'], num_examples=0), [])
+        with self.assertRaises(KeyError):
+            sampler.sample_all(['nonexistentemotion'])
+
+    def test_sampling_is_reproducible_with_seeded_rng(self):
+        """Test that equally seeded generators draw the same examples."""
+        sample_df = self._create_sample_df({
+            'Answer': [f"Happy entry {i}" for i in range(20)],
+            'Answer.f1.happy.raw': [True] * 20
+        })
+        first = get_examples_for_prompt(sample_df, 'happy', num_examples=5, rng=np.random.default_rng(42))
+        second = get_examples_for_prompt(sample_df, 'happy', num_examples=5, rng=np.random.default_rng(42))
+        self.assertEqual(first, second)
+
+        sampler_draw = EmotionSampler(sample_df, rng=np.random.default_rng(42)).sample('happy', num_examples=5)
+        self.assertEqual(sampler_draw, first, "Sampler and function should draw identically from the same seed.")
+
+    def test_emotion_sampler_unknown_emotion(self):
+        """Test that EmotionSampler returns no examples for an emotion without a column."""
+        sampler = EmotionSampler(self._create_sample_df())
+        with patch('builtins.print') as mock_print:
+            examples = sampler.sample('nonexistentemotion', num_examples=2)
+        self.assertEqual(examples, [])
+        self.assertTrue(any("Warning: Emotion column for 'nonexistentemotion' not found" in call_args.args[0]
+                            for call_args in mock_print.call_args_list))
+
+    def test_build_emotion_bitmask(self):
+        """Test that each row packs its emotion labels into the matching bits."""
+        sample_df = self._create_sample_df({
+            'Answer': ["Happy Day", "Sad Story", "Bittersweet", "Nothing"],
+            'Answer.f1.happy.raw': [True, False, True, False],
+            'Answer.f1.sad.raw': [False, True, True, False]
+        })
+        bitmask = build_emotion_bitmask(sample_df)
+        happy_bit, sad_bit = 1 << EMOTION_BITS['happy'], 1 << EMOTION_BITS['sad']
+        self.assertEqual(bitmask.dtype, np.uint32)
+        self.assertEqual(bitmask.tolist(), [happy_bit, sad_bit, happy_bit | sad_bit, 0])
+
+    def test_build_emotion_bitmask_covers_every_emotion_bit(self):
+        """Test that all emotion columns land on their own bit, and that frames without emotions give zeros."""
+        data = {'Answer': [f"Only {emotion}" for emotion in ALL_AVAILABLE_EMOTIONS]}
+        for row, col in enumerate(EMOTION_COLUMNS):
+            data[col] = [other_row == row for other_row in range(len(EMOTION_COLUMNS))]
+        bitmask = build_emotion_bitmask(self._create_sample_df(data))
+        self.assertEqual(bitmask.tolist(), [1 << EMOTION_BITS[emotion] for emotion in ALL_AVAILABLE_EMOTIONS])
+
+        no_emotions = build_emotion_bitmask(self._create_sample_df({'Answer': ["Entry 1", "Entry 2"]}))
+        self.assertEqual(no_emotions.dtype, np.uint32)
+        self.assertEqual(no_emotions.tolist(), [0, 0])
+
+    def test_find_rows_with_emotions(self):
+        """Test single and combined emotion queries against the packed bitmask."""
+        sample_df = self._create_sample_df({
+            'Answer': ["Happy Day", "Sad Story", "Bittersweet", "Nothing"],
+            'Answer.f1.happy.raw': [True, False, True, False],
+            'Answer.f1.sad.raw': [False, True, True, False]
+        })
+        bitmask = build_emotion_bitmask(sample_df)
+        self.assertEqual(find_rows_with_emotions(bitmask, ['happy']).tolist(), [0, 2])
+        self.assertEqual(find_rows_with_emotions(bitmask, ['Happy', 'SAD']).tolist(), [2])
+        self.assertEqual(find_rows_with_emotions(bitmask, ['proud']).tolist(), [])
+        with self.assertRaises(KeyError):
+            find_rows_with_emotions(bitmask, ['nonexistentemotion'])
+
+    def test_get_examples_for_prompt_uses_emotion_index(self):
+        """Test that examples come from the precomputed index rather than the emotion column."""
+        sample_df = self._create_sample_df({
+            'Answer': ["Happy Day", "Joyful Times", "Sad Story"],
+            'Answer.f1.happy.raw': [True, True, False]
+        })
+        index = build_emotion_index(sample_df)
+        examples = get_examples_for_prompt(sample_df, 'HAPPY', num_examples=2, emotion_index=index)
+        self.assertCountEqual(examples, ["Happy Day", "Joyful Times"])
+
+        # The column is not consulted when the index covers the emotion
+        sample_df['Answer.f1.happy.raw'] = [False, False, False]
+        examples = get_examples_for_prompt(sample_df, 'happy', num_examples=1, emotion_index=index)
+        self.assertEqual(len(examples), 1)
+        self.assertIn(examples[0], ["Happy Day", "Joyful Times"])
+
     def test_get_examples_for_prompt_zero_examples_requested(self):
         """Test requesting zero examples returns an empty list."""
         sample_df = self._create_sample_df()
@@ -180,16 +433,20 @@ class TestDataLoader(unittest.TestCase):
         self.assertEqual(len(examples), 0)
 
     def test_get_examples_for_prompt_emotion_column_not_boolean(self):
-        """Test behavior when the target emotion column is not boolean and cannot be converted."""
+        """Test that a non-boolean emotion column (one that skipped preprocessing) is rejected, not coerced."""
         sample_df = pd.DataFrame({
             'Answer': ["Entry A", "Entry B"],
             'Answer.f1.weird.raw': ["Yes", "No"] # Not TRUE/FALSE, not 0/1
         })
-        with patch('builtins.print') as mock_print:
-            examples = get_examples_for_prompt(sample_df, 'weird', num_examples=1)
-        self.assertEqual(len(examples), 0)
-        self.assertTrue(any("Warning: Emotion column Answer.f1.weird.raw is not boolean." in call_args.args[0]
-                            for call_args in mock_print.call_args_list))
+        with self.assertRaisesRegex(AssertionError, "Answer.f1.weird.raw is not boolean"):
+            get_examples_for_prompt(sample_df, 'weird', num_examples=1)
+        self.assertEqual(sample_df['Answer.f1.weird.raw'].tolist(), ["Yes", "No"])
+
+    def test_tone_to_column_mapping(self):
+        """Test that every available emotion maps to its own dataset column."""
+        self.assertEqual(list(TONE_TO_COLUMN), ALL_AVAILABLE_EMOTIONS)
+        self.assertEqual(list(TONE_TO_COLUMN.values()), EMOTION_COLUMNS)
+        self.assertEqual(TONE_TO_COLUMN['happy'], 'Answer.f1.happy.raw')
 
     def test_all_available_emotions_list(self):
         """Test that ALL_AVAILABLE_EMOTIONS is a non-empty list of strings."""
@@ -205,5 +462,36 @@ class TestDataLoader(unittest.TestCase):
         self.assertIn("surprised", ALL_AVAILABLE_EMOTIONS)
 
 
+class TestDataLoaderLocal(unittest.TestCase):
+    """Runs the real loader end to end against a small committed sample of the dataset."""
+    FIXTURE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'emotions_sample.csv')
+
+    @classmethod
+    def setUpClass(cls):
+        """Load the fixture once for the class, with the Parquet cache disabled."""
+        _load_and_preprocess_file.cache_clear()
+        with patch('data_loader.LOCAL_DATA_FILE', cls.FIXTURE_FILE), patch('data_loader.DATA_CACHE_FILE', None), \
+             patch('builtins.print'):
+            cls.df = load_and_preprocess_data()
+        _load_and_preprocess_file.cache_clear()
+
+    def test_fixture_loads_only_used_columns(self):
+        """Test that the topic columns are skipped and every emotion column arrives as bool."""
+        self.assertEqual(len(self.df), 12)
+        self.assertEqual(list(self.df.columns), ['Answer', *EMOTION_COLUMNS])
+        for col in EMOTION_COLUMNS:
+            self.assertTrue(pd.api.types.is_bool_dtype(self.df[col]), f"{col} should be boolean")
+        self.assertTrue(self.df['Answer'].str.len().gt(0).all())
+
+    def test_fixture_examples_match_emotion(self):
+        """Test that sampled examples come from rows flagged with the requested emotion."""
+        happy_answers = set(self.df.loc[self.df['Answer.f1.happy.raw'], 'Answer'])
+        sampler = EmotionSampler(self.df, rng=np.random.default_rng(0))
+        with patch('builtins.print'):
+            examples = sampler.sample('happy', 3)
+        self.assertEqual(len(examples), 3)
+        self.assertTrue(set(examples) <= happy_answers)
+
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
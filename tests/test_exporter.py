@@ -1,57 +1,63 @@
 import unittest
+import itertools
 import os
-import shutil
-import sys
-from unittest.mock import patch, MagicMock
-
-# Add the src directory to the Python path
-current_dir = os.path.dirname(os.path.abspath(__file__))
-src_dir = os.path.join(current_dir, "..", "src")
-sys.path.insert(0, src_dir)
+import tempfile
+from unittest.mock import patch, MagicMock, mock_open, call
 
 from exporter import JournalExporter
-# utils.construct_filename will still be used by the exporter, but its input is from the mocked timestamp func
+# utils.construct_filename will still be used by the exporter; its ID is the mocked run timestamp plus a sequence number
 # utils.generate_file_id and utils.get_current_datetime_str are no longer used by exporter for ID generation
 import utils # Keep for patching its method
 
 class TestJournalExporter(unittest.TestCase):
-    TEST_OUTPUT_DIR = "test_generated_entries_temp_timestamp"
+    RUN_ID = "20231101_100000123456" # Frozen run timestamp every exporter in this class gets by default
+
+    @classmethod
+    def setUpClass(cls):
+        """Create one temporary root for the whole class, in RAM (/dev/shm) where available, and freeze the run timestamp."""
+        cls._tmp = tempfile.TemporaryDirectory(prefix='je_', dir=('/dev/shm' if os.path.isdir('/dev/shm') else None))
+        cls.clock_patcher = patch('utils.get_current_datetime_str_for_file_id', return_value=cls.RUN_ID)
+        cls.mock_get_timestamp_id = cls.clock_patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Unfreeze the clock and remove the temporary root and everything the tests wrote under it."""
+        cls.clock_patcher.stop()
+        cls._tmp.cleanup()
 
     def setUp(self):
-        """Create a temporary directory for test output files."""
-        if os.path.exists(self.TEST_OUTPUT_DIR):
-            shutil.rmtree(self.TEST_OUTPUT_DIR)
-        # Exporter will create the directory
-        # os.makedirs(self.TEST_OUTPUT_DIR, exist_ok=True)
+        """Give each test a fresh, empty output directory under the class root."""
+        self.TEST_OUTPUT_DIR = tempfile.mkdtemp(dir=self._tmp.name)
+        self.mock_get_timestamp_id.return_value = self.RUN_ID
         self.exporter = JournalExporter(output_dir=self.TEST_OUTPUT_DIR)
 
-    def tearDown(self):
-        """Remove the temporary directory and its contents after tests."""
-        if os.path.exists(self.TEST_OUTPUT_DIR):
-            shutil.rmtree(self.TEST_OUTPUT_DIR)
-
     def test_exporter_initialization_creates_directory(self):
         """Test that the exporter creates the output directory if it doesn't exist."""
         new_dir = os.path.join(self.TEST_OUTPUT_DIR, "new_sub_dir_ts")
-        if os.path.exists(new_dir):
-            shutil.rmtree(new_dir)
         self.assertFalse(os.path.exists(new_dir))
         JournalExporter(output_dir=new_dir) # Initialize to trigger directory creation
         self.assertTrue(os.path.exists(new_dir), "Exporter should create the output directory.")
 
-    @patch('utils.get_current_datetime_str_for_file_id')
-    def test_save_entry_creates_file_with_timestamp_id(self, mock_get_timestamp_id):
-        """Test that save_entry creates a file with a mocked timestamp-based ID and correct content."""
-        entry_text = "This is a test journal entry with a timestamp ID."
-        mocked_timestamp_id = "20231101_100000123456"
-        mock_get_timestamp_id.return_value = mocked_timestamp_id
-        
-        expected_filename = utils.construct_filename(mocked_timestamp_id) # Uses the new construct_filename signature
+    def _make_exporter(self, run_id):
+        """Creates an exporter whose run timestamp ID is fixed to run_id."""
+        self.mock_get_timestamp_id.reset_mock()
+        self.mock_get_timestamp_id.return_value = run_id
+        exporter = JournalExporter(output_dir=self.TEST_OUTPUT_DIR)
+        self.mock_get_timestamp_id.assert_called_once() # The clock is read once per exporter, not per entry
+        return exporter
+
+    def test_save_entry_creates_file_with_timestamp_id(self):
+        """Test that save_entry creates a file named from the run timestamp and a sequence number, with correct content."""
+        entry_text = "This is a test journal entry with a timestamp ID. Café, naïve — ✓"
+        exporter = self._make_exporter(self.RUN_ID)
+
+        expected_filename = utils.construct_filename(f"{self.RUN_ID}_000001")
         expected_filepath = os.path.join(self.TEST_OUTPUT_DIR, expected_filename)
 
-        saved_filepath = self.exporter.save_entry(entry_text)
-        
-        mock_get_timestamp_id.assert_called_once()
+        self.mock_get_timestamp_id.reset_mock()
+        saved_filepath = exporter.save_entry(entry_text)
+
+        self.mock_get_timestamp_id.assert_not_called()
         self.assertEqual(saved_filepath, expected_filepath)
         self.assertTrue(os.path.exists(expected_filepath), "File should be created.")
 
@@ -59,49 +65,100 @@ class TestJournalExporter(unittest.TestCase):
             content = f.read()
         self.assertEqual(content, entry_text, "File content does not match the entry text.")
 
+    def test_save_entry_writes_platform_line_endings(self):
+        """Test that newlines in an entry are written in the platform's convention (os.linesep), e.g. CRLF on Windows."""
+        saved_filepath = self.exporter.save_entry("First line.\nSecond line.\n")
+
+        with open(saved_filepath, 'rb') as f:
+            raw = f.read()
+        linesep = os.linesep.encode()
+        self.assertEqual(raw, b"First line." + linesep + b"Second line." + linesep)
+
     def test_save_entry_handles_empty_text_timestamp(self):
         """Test that save_entry does not create a file for empty text and returns None (timestamp version)."""
-        with patch('utils.get_current_datetime_str_for_file_id') as mock_get_timestamp_id:
-            saved_filepath = self.exporter.save_entry("")
-            self.assertIsNone(saved_filepath, "Should return None for empty entry text.")
-            mock_get_timestamp_id.assert_not_called() # Should not try to get a timestamp if text is empty
-
-    @patch('utils.get_current_datetime_str_for_file_id')
-    def test_multiple_saves_create_unique_files_with_mocked_timestamps(self, mock_get_timestamp_id):
-        """Test that multiple calls to save_entry with different mocked timestamps create unique files."""
-        entry_text_1 = "First entry."
-        entry_text_2 = "Second entry."
-        timestamp_1 = "20231101_110000000000"
-        timestamp_2 = "20231101_110000111111"
-
-        # Configure mock to return different values on subsequent calls
-        mock_get_timestamp_id.side_effect = [timestamp_1, timestamp_2]
+        saved_filepath = self.exporter.save_entry("")
+        self.assertIsNone(saved_filepath, "Should return None for empty entry text.")
+        self.assertEqual(os.listdir(self.TEST_OUTPUT_DIR), [], "No file should be written for empty text.")
+
+    @patch('builtins.open', new_callable=mock_open)
+    def test_multiple_saves_create_unique_files_with_sequence_numbers(self, mock_file):
+        """Test that multiple calls to save_entry within one run create unique, ordered files."""
+        timestamp = "20231101_110000000000"
+        exporter = self._make_exporter(timestamp)
 
         # First save
-        saved_filepath_1 = self.exporter.save_entry(entry_text_1)
-        expected_filename_1 = utils.construct_filename(timestamp_1)
+        saved_filepath_1 = exporter.save_entry("First entry.")
         self.assertIsNotNone(saved_filepath_1)
-        self.assertEqual(os.path.basename(saved_filepath_1), expected_filename_1)
-        self.assertTrue(os.path.exists(saved_filepath_1))
+        self.assertEqual(os.path.basename(saved_filepath_1), utils.construct_filename(f"{timestamp}_000001"))
 
-        # Second save
-        saved_filepath_2 = self.exporter.save_entry(entry_text_2)
-        expected_filename_2 = utils.construct_filename(timestamp_2)
+        # Second save, immediately after: no sleep needed to get a distinct name
+        saved_filepath_2 = exporter.save_entry("Second entry.")
         self.assertIsNotNone(saved_filepath_2)
-        self.assertEqual(os.path.basename(saved_filepath_2), expected_filename_2)
-        self.assertTrue(os.path.exists(saved_filepath_2))
+        self.assertEqual(os.path.basename(saved_filepath_2), utils.construct_filename(f"{timestamp}_000002"))
 
         self.assertNotEqual(saved_filepath_1, saved_filepath_2, "Filenames should be unique.")
-        self.assertEqual(mock_get_timestamp_id.call_count, 2)
+        self.assertLess(saved_filepath_1, saved_filepath_2, "Filenames should sort in save order.")
+        mock_file.assert_has_calls([
+            call(saved_filepath_1, 'w', encoding='utf-8'),
+            call(saved_filepath_2, 'w', encoding='utf-8'),
+        ], any_order=True)
+        self.assertEqual(mock_file().write.call_args_list, [call("First entry."), call("Second entry.")])
+
+    def test_save_entry_pads_sequence_number(self):
+        """Test the zero-padding of the sequence number in the file ID, without writing any files."""
+        timestamp = "20231101_120000000000"
+        exporter = self._make_exporter(timestamp)
+        for sequence_number, suffix in [(1, '_000001.txt'), (10, '_000010.txt'), (999999, '_999999.txt'), (1000000, '_1000000.txt')]:
+            with self.subTest(sequence_number=sequence_number), patch('builtins.open', mock_open()):
+                exporter._sequence = itertools.count(sequence_number)
+                saved_filepath = exporter.save_entry("x")
+                self.assertEqual(os.path.basename(saved_filepath), f"journal_{timestamp}{suffix}")
+
+    @patch('builtins.open', new_callable=mock_open)
+    def test_save_entries_writes_all_in_order(self, mock_file):
+        """Test that save_entries writes each non-empty entry and returns paths in input order."""
+        entry_texts = ["First entry.", "", "Third entry."]
+        timestamp = "20231101_130000000000"
+        exporter = self._make_exporter(timestamp)
+
+        saved_filepaths = exporter.save_entries(entry_texts)
+
+        expected_filepaths = [
+            os.path.join(self.TEST_OUTPUT_DIR, utils.construct_filename(f"{timestamp}_000001")),
+            None, # Empty entries are skipped without consuming a sequence number
+            os.path.join(self.TEST_OUTPUT_DIR, utils.construct_filename(f"{timestamp}_000002")),
+        ]
+        self.assertEqual(saved_filepaths, expected_filepaths)
+        # Writes run on a thread pool, so only the set of (path, text) pairs is deterministic
+        opened_paths = [c.args[0] for c in mock_file.call_args_list if c.args]
+        self.assertCountEqual(opened_paths, [expected_filepaths[0], expected_filepaths[2]])
+        self.assertCountEqual(mock_file().write.call_args_list, [call("First entry."), call("Third entry.")])
+
+    def test_save_entries_durable_fsyncs_files_and_directory_once(self):
+        """Test that durable save_entries fsyncs every written file, then the output directory once per batch."""
+        exporter = self._make_exporter("20231101_140000000000")
+
+        with patch('exporter.os.fsync', wraps=os.fsync) as mock_fsync, \
+             patch.object(exporter, '_sync_output_dir', wraps=exporter._sync_output_dir) as mock_sync_dir:
+            saved_filepaths = exporter.save_entries(["First entry.", "", "Third entry."], durable=True)
+
+        self.assertEqual(sum(1 for filepath in saved_filepaths if filepath), 2)
+        mock_sync_dir.assert_called_once()
+        self.assertEqual(mock_fsync.call_count, 3) # Two files plus the directory
+
+    def test_save_entries_not_durable_skips_fsync(self):
+        """Test that the default (non-durable) save_entries never fsyncs."""
+        exporter = self._make_exporter("20231101_150000000000")
+        with patch('exporter.os.fsync') as mock_fsync:
+            exporter.save_entries(["First entry."])
+        mock_fsync.assert_not_called()
 
     def test_save_entry_io_error_timestamp(self):
         """Test how save_entry handles an IOError (timestamp version)."""
-        with patch('utils.get_current_datetime_str_for_file_id', return_value="20231101_120000000000") as mock_ts:
-            with patch('builtins.open', side_effect=IOError("Disk full simulation")) as mock_open:
-                saved_filepath = self.exporter.save_entry("text")
-                self.assertIsNone(saved_filepath, "Should return None on IOError.")
-                mock_ts.assert_called_once() # Timestamp should still be generated
-                mock_open.assert_called_once() # Open should have been attempted
+        with patch('builtins.open', side_effect=IOError("Disk full simulation")) as mock_open:
+            saved_filepath = self.exporter.save_entry("text")
+            self.assertIsNone(saved_filepath, "Should return None on IOError.")
+            mock_open.assert_called_once() # Open should have been attempted
 
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -1,55 +1,100 @@
+import asyncio
 import unittest
-from unittest.mock import patch, MagicMock, PropertyMock
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock, AsyncMock, DEFAULT
 import os
-import sys
 
-# Add the src directory to the Python path to allow imports
-current_dir = os.path.dirname(os.path.abspath(__file__))
-src_dir = os.path.join(current_dir, "..", "src")
-sys.path.insert(0, src_dir)
-
-# Now import after path setup
 from generator import JournalGenerator, MODEL_NAME # Import MODEL_NAME for checks
 import utils
-import google.generativeai as genai # For type hinting the mock response
+
+def _resp(text=None, parts=None, candidates=None, prompt_feedback=None):
+    """
+    Builds a stand-in Gemini response with just the attributes the generator reads (.text, .parts,
+    .candidates and .prompt_feedback). A plain namespace is far cheaper than a spec'd MagicMock.
+    When only text is given, it also gets a single part, like a real response with text.
+    """
+    if parts is None and text is not None:
+        parts = [SimpleNamespace(text=text)]
+    return SimpleNamespace(text=text, parts=parts, candidates=candidates, prompt_feedback=prompt_feedback)
+
+def _text_response(text):
+    """Builds a stand-in Gemini response whose .text is text. The generator only reads responses, so one can be shared."""
+    return _resp(text=text)
+
+# Plain-text responses are built once at import and shared by the tests
+_DEFAULT_RESPONSE = _text_response("This is a mock LLM response from Gemini.")
+_NOSTALGIC_RESPONSE = _text_response("A nostalgic piece from mock Gemini.")
+_ASYNC_RESPONSES = [_text_response("First async entry."), _text_response("Third async entry.")]
+_ASYNC_ENTRY_RESPONSE = _text_response("An async entry.")
+
+def _loop_bound_generate_content_async(response):
+    """
+    Builds a fake generate_content_async that, like the SDK's gRPC aio client, binds to the event loop of its
+    first call and fails with "Event loop is closed" when awaited on any other loop afterwards.
+    """
+    bound_loop = None
+
+    async def generate_content_async(prompt_text, generation_config):
+        nonlocal bound_loop
+        running_loop = asyncio.get_running_loop()
+        if bound_loop is None:
+            bound_loop = running_loop
+        elif bound_loop is not running_loop:
+            raise RuntimeError("Event loop is closed")
+        await asyncio.sleep(0) # Yield to the event loop like a real network call
+        return response
+
+    return generate_content_async
+
+# The generator's sizing heuristics, stated once so a change to them is a one-line test update
+def _expected_max_output(avg_word_count):
+    """max_output_tokens the generator computes when the caller doesn't override it."""
+    return max(50, int(avg_word_count * 1.5) + 30)
+
+def _expected_overshoot(avg_word_count):
+    """max_overshoot_words the generator passes to smart_truncate_text."""
+    return int(avg_word_count * 0.10)
 
 class TestJournalGenerator(unittest.TestCase):
 
-    @patch('os.getenv') # Patch os.getenv first
-    @patch('google.generativeai.GenerativeModel') # Then patch GenerativeModel
-    def setUp(self, mock_generative_model, mock_os_getenv):
-        """Set up for each test. Mock environment variables and Gemini model."""
-        # Configure os.getenv mock
-        mock_os_getenv.return_value = "FAKE_API_KEY" # Mock API key
+    @classmethod
+    def setUpClass(cls):
+        """Build one generator for the whole class with the API key and Gemini model mocked."""
+        # Patch genai.GenerativeModel first, then os.getenv, so __init__ sees a fake key and our model mock.
+        # Starting the model patch imports the SDK (the generator imports it lazily), and that import reads
+        # real environment variables, so it must happen before os.getenv is faked.
+        cls.generative_model_patcher = patch('google.generativeai.GenerativeModel')
+        cls.getenv_patcher = patch('os.getenv', return_value="FAKE_API_KEY") # Mock API key
+        # Each patch is stopped by a class cleanup registered as soon as it starts, so a failure
+        # later in setUpClass (including the SkipTest below) still unpatches everything
+        cls.mock_generative_model_class = cls.generative_model_patcher.start() # The class mock
+        cls.addClassCleanup(cls.generative_model_patcher.stop)
+        cls.mock_os_getenv = cls.getenv_patcher.start()
+        cls.addClassCleanup(cls.getenv_patcher.stop)
 
-        # Configure the mock for genai.GenerativeModel instance
-        self.mock_model_instance = MagicMock()
-        # The generate_content method needs to return an object that mimics Gemini's response.
-        # This response object should have a .text attribute or .parts attribute.
-        mock_gemini_response = MagicMock(spec=genai.types.GenerateContentResponse)
-        mock_gemini_response.text = "This is a mock LLM response from Gemini." # Default mock response text
-        # For more complex scenarios, you might mock response.parts or response.candidates
-        # e.g. type(mock_gemini_response).parts = PropertyMock(return_value=[MagicMock(text=...)])
-        self.mock_model_instance.generate_content.return_value = mock_gemini_response
-        
         # Make genai.GenerativeModel return our instance mock
-        mock_generative_model.return_value = self.mock_model_instance
-
-        # Store mocks for assertions
-        self.mock_os_getenv = mock_os_getenv
-        self.mock_generative_model_class = mock_generative_model # The class mock
+        cls.mock_model_instance = MagicMock()
+        cls.mock_generative_model_class.return_value = cls.mock_model_instance
 
-        # Now, when JournalGenerator is instantiated, it will use our mocks
+        # Now, when JournalGenerator is instantiated, it will use our mocks. Its constructor only wires up
+        # the client, so one instance can serve every test; setUp resets the model mock between tests.
         try:
-            self.generator = JournalGenerator()
+            cls.generator = JournalGenerator()
         except Exception as e:
-            self.fail(f"JournalGenerator instantiation failed even with mocks: {e}")
+            raise unittest.SkipTest(f"JournalGenerator instantiation failed even with mocks: {e}")
+        cls.addClassCleanup(cls.generator.close) # Closes the event loop generate_entries keeps
 
-    def tearDown(self):
-        """Clean up after each test by stopping all patches if necessary."""
-        # Patches started with @patch decorators are automatically stopped.
-        # If we started any patches manually with .start(), we'd call .stop() here.
-        pass
+    def setUp(self):
+        """Reset the shared model mock so each test starts from the default Gemini response."""
+        # Only the API methods' behaviour is reset; resetting the instance's own return values would also
+        # reset its magic methods, so `if not self.model` would fail on a MagicMock returned from __bool__
+        self.mock_model_instance.reset_mock()
+        self.mock_model_instance.generate_content.reset_mock(return_value=True, side_effect=True)
+        self.mock_model_instance.generate_content_async = AsyncMock()
+        # The generate_content method needs to return an object that mimics Gemini's response.
+        # This response object should have a .text attribute or .parts attribute.
+        # For more complex scenarios, tests build their own response with mocked .parts or .candidates
+        self.mock_model_instance.generate_content.return_value = _DEFAULT_RESPONSE
 
     def test_generator_initialization(self):
         """Test that the JournalGenerator initializes correctly with mocks."""
@@ -63,44 +108,36 @@ class TestJournalGenerator(unittest.TestCase):
         # Check that genai.GenerativeModel (the class) was called to create an instance
         self.mock_generative_model_class.assert_called_once_with(MODEL_NAME)
 
-    def test_construct_prompt_text_basic(self):
-        """Test the basic prompt text construction without examples."""
-        target_emotion = "curious"
-        avg_word_count = 50
-        prompt_text = self.generator._construct_prompt_text(target_emotion, avg_word_count)
-        
-        self.assertIsInstance(prompt_text, str)
-        self.assertIn(f"tone/style preset: {target_emotion}", prompt_text)
-        self.assertIn(f"approximately {avg_word_count} words long", prompt_text)
-        self.assertIn("Generate only the journal entry text itself", prompt_text)
-        self.assertNotIn("Example 1:", prompt_text)
-        self.assertIn("Write the new journal entry now", prompt_text)
-
-    def test_construct_prompt_text_with_examples(self):
-        """Test prompt text construction with few-shot examples."""
-        target_emotion = "excited"
-        avg_word_count = 70
+    def test_construct_prompt_text(self):
+        """Test prompt text construction with and without few-shot examples."""
         example_entries = ["Example entry 1 about excitement.", "Example entry 2, also very exciting!"]
-        prompt_text = self.generator._construct_prompt_text(target_emotion, avg_word_count, example_entries)
-        
-        self.assertIsInstance(prompt_text, str)
-        self.assertIn(f"tone/style preset: {target_emotion}", prompt_text)
-        self.assertIn(f"approximately {avg_word_count} words long", prompt_text)
-        self.assertIn("Example 1: \"Example entry 1 about excitement.\"", prompt_text)
-        self.assertIn(f'Example 2: "{example_entries[1]}"', prompt_text) # Using f-string for the second example
-        self.assertIn("Based on these examples", prompt_text)
+        cases = [
+            # (target_emotion, avg_word_count, example_entries, expected fragments, unexpected fragments)
+            ("curious", 50, None,
+             ["Generate only the journal entry text itself", "Write the new journal entry now"], ["Example 1:"]),
+            ("excited", 70, example_entries,
+             ["Example 1: \"Example entry 1 about excitement.\"", f'Example 2: "{example_entries[1]}"', "Based on these examples"], []),
+        ]
+        for target_emotion, avg_word_count, examples, expected, unexpected in cases:
+            with self.subTest(target_emotion=target_emotion):
+                prompt_text = self.generator._construct_prompt_text(target_emotion, avg_word_count, examples)
+
+                self.assertIsInstance(prompt_text, str)
+                required = [f"tone/style preset: {target_emotion}", f"approximately {avg_word_count} words long", *expected]
+                missing = [fragment for fragment in required if fragment not in prompt_text]
+                present = [fragment for fragment in unexpected if fragment in prompt_text]
+                self.assertFalse(missing, f"Prompt is missing: {missing}")
+                self.assertFalse(present, f"Prompt should not contain: {present}")
 
     def test_generate_entry_calls_gemini_and_processes_response(self):
         """Test that generate_entry calls the Gemini API and processes the response."""
         target_emotion = "nostalgic"
         avg_word_count = 60
         max_tokens_override = 0 # Let generator calculate
-        expected_mock_response_text = "A nostalgic piece from mock Gemini."
+        expected_mock_response_text = _NOSTALGIC_RESPONSE.text
 
         # Configure the mock model instance's generate_content for this test
-        mock_response = MagicMock(spec=genai.types.GenerateContentResponse)
-        mock_response.text = expected_mock_response_text
-        self.mock_model_instance.generate_content.return_value = mock_response
+        self.mock_model_instance.generate_content.return_value = _NOSTALGIC_RESPONSE
 
         generated_text = self.generator.generate_entry(
             target_emotion, 
@@ -118,109 +155,146 @@ class TestJournalGenerator(unittest.TestCase):
         # kwargs_call should contain generation_config
         self.assertIn('generation_config', kwargs_call)
         gen_config = kwargs_call['generation_config']
+        import google.generativeai as genai # Only this check needs the real SDK types
         self.assertIsInstance(gen_config, genai.types.GenerationConfig)
         
         # Check some default generation_config values (or calculated ones)
-        # Heuristic from generator: max(50, int(avg_word_count * 1.5) + 30)
-        expected_max_output_tokens = max(50, int(avg_word_count * 1.5) + 30)
+        expected_max_output_tokens = _expected_max_output(avg_word_count)
         self.assertEqual(gen_config.max_output_tokens, expected_max_output_tokens)
         self.assertEqual(gen_config.temperature, 0.7)
         
         # Assuming utils.clean_generated_text just strips, and no truncation needed for this length
         self.assertEqual(generated_text, expected_mock_response_text.strip()) 
 
-    def test_generate_entry_handles_gemini_failure(self):
-        """Test that generate_entry returns empty string if Gemini API call fails."""
-        self.mock_model_instance.generate_content.side_effect = Exception("Gemini simulated error")
-        generated_text = self.generator.generate_entry("any_emotion", 50)
-        self.assertEqual(generated_text, "")
-
-    def test_generate_entry_handles_unexpected_gemini_response(self):
-        """Test handling of unexpected response format or blocked prompt from Gemini."""
-        # Scenario 1: Response object with no .text and no .parts (or empty parts)
-        mock_response_no_text = MagicMock(spec=genai.types.GenerateContentResponse)
-        # Ensure .text would raise or be None, and .parts is not there or empty
-        type(mock_response_no_text).text = PropertyMock(side_effect=AttributeError('no text attribute'))
-        type(mock_response_no_text).parts = PropertyMock(return_value=[]) # No parts
-        # Simulate a prompt block reason as well
-        mock_response_no_text.prompt_feedback = MagicMock()
-        mock_response_no_text.prompt_feedback.block_reason = "SAFETY"
-        
-        self.mock_model_instance.generate_content.return_value = mock_response_no_text
-        generated_text = self.generator.generate_entry("any_emotion", 50)
-        self.assertEqual(generated_text, "", "Should return empty string for unusable Gemini response with block reason.")
-
-        # Scenario 2: Response object with .candidates but empty parts inside candidate
-        mock_candidate_part = MagicMock()
-        mock_candidate_part.text = ""
-        mock_candidate = MagicMock()
-        mock_candidate.content = MagicMock()
-        mock_candidate.content.parts = [mock_candidate_part] # Empty text in part
-        mock_response_empty_candidate_parts = MagicMock(spec=genai.types.GenerateContentResponse)
-        type(mock_response_empty_candidate_parts).text = PropertyMock(side_effect=AttributeError('no direct text attribute'))
-        type(mock_response_empty_candidate_parts).parts = PropertyMock(return_value=None) # No direct parts
-        mock_response_empty_candidate_parts.candidates = [mock_candidate]
-        mock_response_empty_candidate_parts.prompt_feedback = None # No block reason this time
-
-        self.mock_model_instance.generate_content.return_value = mock_response_empty_candidate_parts
-        generated_text = self.generator.generate_entry("another_emotion", 50)
-        self.assertEqual(generated_text, "", "Should return empty string for Gemini response with empty candidate parts.")
+    def test_generate_entry_returns_empty_for_unusable_gemini_output(self):
+        """Test that a failed Gemini call, or a response with no usable text, yields an empty string."""
+        # Response object with no text and no parts, and a prompt block reason
+        mock_response_no_text = _resp(parts=[], prompt_feedback=SimpleNamespace(block_reason="SAFETY"))
+
+        # Response object with no direct parts, and a candidate whose only part has empty text
+        mock_candidate = SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text="")]))
+        mock_response_empty_candidate_parts = _resp(candidates=[mock_candidate]) # No block reason this time
+
+        cases = [
+            # (description, side_effect, return_value)
+            ("api error", Exception("Gemini simulated error"), None),
+            ("blocked prompt", None, mock_response_no_text),
+            ("empty candidate parts", None, mock_response_empty_candidate_parts),
+        ]
+        for description, side_effect, return_value in cases:
+            with self.subTest(description):
+                self.mock_model_instance.generate_content.reset_mock(return_value=True, side_effect=True)
+                if side_effect:
+                    self.mock_model_instance.generate_content.side_effect = side_effect
+                else:
+                    self.mock_model_instance.generate_content.return_value = return_value
+                self.assertEqual(self.generator.generate_entry("any_emotion", 50), "")
+                self.mock_model_instance.generate_content.assert_called_once()
+
+    def test_generate_entries_runs_requests_concurrently_in_order(self):
+        """Test that generate_entries issues async Gemini calls and returns results in request order."""
+        self.mock_model_instance.generate_content_async = AsyncMock(side_effect=[
+            _ASYNC_RESPONSES[0],
+            Exception("Gemini simulated error"),
+            _ASYNC_RESPONSES[1],
+        ])
+        entry_requests = [
+            {"target_emotion": "happy", "avg_word_count": 3},
+            {"target_emotion": "sad", "avg_word_count": 3},
+            {"target_emotion": "calm", "avg_word_count": 3, "example_entries": ["A calm example."]},
+        ]
+
+        generated_texts = self.generator.generate_entries(entry_requests, max_concurrent=2)
+
+        self.assertEqual(generated_texts, ["First async entry.", "", "Third async entry."])
+        self.assertEqual(self.mock_model_instance.generate_content_async.await_count, 3)
+        self.mock_model_instance.generate_content.assert_not_called()
+        prompts = [call_args.args[0] for call_args in self.mock_model_instance.generate_content_async.call_args_list]
+        self.assertIn("tone/style preset: calm", prompts[2])
+        self.assertIn("A calm example.", prompts[2])
+
+    def test_generate_entries_builds_prompts_before_waiting_for_a_slot(self):
+        """Test that every prompt is built while the first request is still in flight."""
+        prompts_built_at_first_response = []
+
+        async def fake_generate_content_async(prompt_text, generation_config):
+            await asyncio.sleep(0) # Yield to the event loop like a real network call
+            if not prompts_built_at_first_response:
+                prompts_built_at_first_response.append(mock_build_request.call_count)
+            return _ASYNC_ENTRY_RESPONSE
+
+        self.mock_model_instance.generate_content_async = AsyncMock(side_effect=fake_generate_content_async)
+        entry_requests = [{"target_emotion": "happy", "avg_word_count": 3} for _ in range(3)]
+
+        with patch.object(self.generator, '_build_request', wraps=self.generator._build_request) as mock_build_request:
+            generated_texts = self.generator.generate_entries(entry_requests, max_concurrent=1)
+
+        self.assertEqual(generated_texts, ["An async entry."] * 3)
+        self.assertEqual(prompts_built_at_first_response, [3])
+
+    def test_generate_entries_reuses_one_event_loop_across_calls(self):
+        """Test that successive generate_entries calls work with an async client bound to the loop of its first call."""
+        self.mock_model_instance.generate_content_async = AsyncMock(
+            side_effect=_loop_bound_generate_content_async(_ASYNC_ENTRY_RESPONSE))
+        entry_requests = [{"target_emotion": "happy", "avg_word_count": 3} for _ in range(2)]
+
+        for _ in range(3):
+            self.assertEqual(self.generator.generate_entries(entry_requests, max_concurrent=2), ["An async entry."] * 2)
+        self.assertEqual(self.mock_model_instance.generate_content_async.await_count, 6)
+
+    def test_agenerate_entries_runs_inside_an_existing_event_loop(self):
+        """Test that agenerate_entries can be awaited from a running loop, where generate_entries' asyncio.run would fail."""
+        self.mock_model_instance.generate_content_async = AsyncMock(return_value=_ASYNC_ENTRY_RESPONSE)
+        entry_requests = [{"target_emotion": "happy", "avg_word_count": 3} for _ in range(2)]
+
+        async def caller_with_running_loop():
+            with self.assertRaisesRegex(RuntimeError, "await agenerate_entries"):
+                self.generator.generate_entries(entry_requests)
+            return await self.generator.agenerate_entries(entry_requests, max_concurrent=2)
+
+        self.assertEqual(asyncio.run(caller_with_running_loop()), ["An async entry."] * 2)
+        self.assertEqual(self.mock_model_instance.generate_content_async.await_count, 2)
 
     def test_generated_text_cleaning_and_truncation(self):
-        """Test that generated text is cleaned and then potentially truncated by utils."""
+        """Test that generated text is cleaned and then truncated by utils only when it overshoots the target."""
         raw_llm_output = "  This is a mock response that is deliberately a bit too long for the target word count. It needs to be truncated.  "
-        
-        target_word_count_unused = 10 # This variable seems unused in the actual logic below, main targets are forced_target_word_count and target_good_length
-        
-        # Configure the mock Gemini response for this test
-        mock_response = MagicMock(spec=genai.types.GenerateContentResponse)
-        mock_response.text = raw_llm_output
-        self.mock_model_instance.generate_content.return_value = mock_response
-        
-        with patch.object(utils, 'clean_generated_text', return_value=raw_llm_output.strip()) as mock_clean:
-            # Scenario 1: Text is too long (based on 50% tolerance) and needs truncation
-            text_that_is_too_long_after_cleaning = "This is cleaned but still very very very very very very long and needs truncation for sure it really does." # count_words (split) = 20
-            forced_target_word_count = 10 # Target for the generator to aim for
-            # Word count (20) vs target (10): 20 is > 10 * 1.5 (15), so it's outside 50% tolerance. Truncation expected.
-            
-            expected_max_overshoot_for_smart_truncate = int(forced_target_word_count * 0.10) # This is for smart_truncate_text's internal check
-            mock_clean.return_value = text_that_is_too_long_after_cleaning 
-            
-            with patch.object(utils, 'smart_truncate_text', return_value="Successfully Truncated Text.") as mock_smart_truncate:
-                generated_text = self.generator.generate_entry(
-                    target_emotion="test_truncation", 
-                    avg_word_count=forced_target_word_count
-                )
-                
-                mock_clean.assert_called_with(raw_llm_output)
-                mock_smart_truncate.assert_called_once_with(
-                    text_that_is_too_long_after_cleaning, 
-                    forced_target_word_count, 
-                    max_overshoot_words=expected_max_overshoot_for_smart_truncate
-                )
-                self.assertEqual(generated_text, "Successfully Truncated Text.")
-
-        # Scenario 2: Text is within 50% tolerance and should not be truncated
-        self.mock_model_instance.generate_content.reset_mock() 
-        
-        text_that_is_good_length = "This text is a pretty good length, not too long not too short just right."
-        # count_words (split) for text_that_is_good_length = 13
-        target_good_length = 10
-        # Word count (13) vs target (10): 13 is <= 10 * 1.5 (15), so it's within 50% tolerance. No truncation expected.
-        
-        mock_response_scenario2 = MagicMock(spec=genai.types.GenerateContentResponse)
-        mock_response_scenario2.text = text_that_is_good_length 
-        self.mock_model_instance.generate_content.return_value = mock_response_scenario2
-
-        with patch.object(utils, 'clean_generated_text', return_value=text_that_is_good_length) as mock_clean_scenario2:
-            with patch.object(utils, 'smart_truncate_text') as mock_smart_truncate_not_called:
-                generated_text = self.generator.generate_entry(
-                    target_emotion="test_no_truncation",
-                    avg_word_count=target_good_length
-                )
-                mock_clean_scenario2.assert_called_once_with(text_that_is_good_length)
-                mock_smart_truncate_not_called.assert_not_called()
-                self.assertEqual(generated_text, text_that_is_good_length)
+        self.mock_model_instance.generate_content.return_value = _resp(text=raw_llm_output)
+
+        too_long = "This is cleaned but still very very very very very very long and needs truncation for sure it really does." # count_words (split) = 20
+        good_length = "This text is a pretty good length, not too long not too short just right." # count_words (split) = 13
+        cases = [
+            # (cleaned text, target word count, truncated text, or None if no truncation is expected)
+            # 20 words is > 10 * 1.5 (15), so it's outside the 50% tolerance
+            (too_long, 10, "Successfully Truncated Text."),
+            # 13 words is <= 10 * 1.5 (15), so it's within the 50% tolerance
+            (good_length, 10, None),
+        ]
+        # Patch both helpers once for the test; each case just resets and reconfigures the mocks
+        with patch.multiple(utils, clean_generated_text=DEFAULT, smart_truncate_text=DEFAULT) as mocks:
+            mock_clean, mock_smart_truncate = mocks['clean_generated_text'], mocks['smart_truncate_text']
+            for cleaned_text, target_word_count, truncated_text in cases:
+                with self.subTest(expect_truncation=truncated_text is not None):
+                    mock_clean.reset_mock()
+                    mock_smart_truncate.reset_mock(return_value=True)
+                    mock_clean.return_value = cleaned_text
+                    mock_smart_truncate.return_value = truncated_text
+
+                    generated_text = self.generator.generate_entry(
+                        target_emotion="test_truncation",
+                        avg_word_count=target_word_count
+                    )
+
+                    mock_clean.assert_called_once_with(raw_llm_output)
+                    if truncated_text is None:
+                        mock_smart_truncate.assert_not_called()
+                        self.assertEqual(generated_text, cleaned_text)
+                    else:
+                        mock_smart_truncate.assert_called_once_with(
+                            cleaned_text,
+                            target_word_count,
+                            max_overshoot_words=_expected_overshoot(target_word_count)
+                        )
+                        self.assertEqual(generated_text, truncated_text)
 
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
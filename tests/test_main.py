@@ -1,163 +1,282 @@
-import unittest
-from unittest.mock import patch, call
+# tests/test_main.py
+import asyncio
 import sys
-import os
-from argparse import Namespace # For creating mock args
-
-# Add the src directory to the Python path to allow imports from main
-current_dir = os.path.dirname(os.path.abspath(__file__))
-src_dir = os.path.join(current_dir, "..", "src")
-sys.path.insert(0, src_dir)
-
-# Import main function and constants
-try:
-    from main import main, DEFAULT_OUTPUT_DIR, ALL_AVAILABLE_EMOTIONS
-except ImportError:
-    # This might happen if script is not run from project root or venv not active
-    # Fallback for simpler test execution if needed, assuming src is in PYTHONPATH
-    print("Attempting fallback import for main due to potential PYTHONPATH issue in test runner.")
-    sys.path.append(os.path.join(os.path.dirname(__file__), '..')) # Add project root
-    from src.main import main, DEFAULT_OUTPUT_DIR, ALL_AVAILABLE_EMOTIONS
-
-
-class TestMainScriptArguments(unittest.TestCase):
-
-    def common_mocks(self):
-        """Return a dictionary of common mocks needed for most tests."""
-        # Mock modules that main.py interacts with
-        mock_load_dotenv = patch('main.load_dotenv') # if main directly calls it
-        mock_load_and_preprocess_data = patch('main.load_and_preprocess_data')
-        mock_get_examples_for_prompt = patch('main.get_examples_for_prompt')
-        mock_journal_generator_class = patch('main.JournalGenerator')
-        mock_journal_exporter_class = patch('main.JournalExporter')
-        
-        # Start patches and return their mock objects
-        mocks = {
-            'load_dotenv': mock_load_dotenv.start(),
-            'load_data': mock_load_and_preprocess_data.start(),
-            'get_examples': mock_get_examples_for_prompt.start(),
-            'GeneratorClass': mock_journal_generator_class.start(),
-            'ExporterClass': mock_journal_exporter_class.start(),
-        }
-        
-        # Configure default return values for mocked instances/methods
-        # Mock the JournalGenerator instance and its generate_entry method
-        self.mock_generator_instance = mocks['GeneratorClass'].return_value
-        self.mock_generator_instance.generate_entry.return_value = "Mocked journal entry"
-
-        # Mock the JournalExporter instance and its save_entry method
-        self.mock_exporter_instance = mocks['ExporterClass'].return_value
-        self.mock_exporter_instance.save_entry.return_value = "mocked_entry.txt"
-        
-        # Mock data loading to return a dummy DataFrame or None
-        mocks['load_data'].return_value = "dummy_dataframe" # Simulate successful load
-        mocks['get_examples'].return_value = ["example 1", "example 2"]
-
-        self.addCleanup(patch.stopall) # Ensure all patches are stopped after each test
-        return mocks
-
-    def test_default_arguments(self):
-        """Test main() with only the required --tone argument, checking defaults."""
-        mocks = self.common_mocks()
-        
-        test_tone = ALL_AVAILABLE_EMOTIONS[0] if ALL_AVAILABLE_EMOTIONS else "happy"
-        cli_args = ['main.py', '--tone', test_tone]
-
-        with patch.object(sys, 'argv', cli_args):
-            main()
-
-        mocks['GeneratorClass'].assert_called_once_with()
-        mocks['ExporterClass'].assert_called_once_with(output_dir=DEFAULT_OUTPUT_DIR)
-        self.mock_generator_instance.generate_entry.assert_called_once()
-        call_args = self.mock_generator_instance.generate_entry.call_args
-        self.assertEqual(call_args.kwargs['target_emotion'], test_tone)
-        self.assertEqual(call_args.kwargs['avg_word_count'], 100)
-        self.assertEqual(len(call_args.kwargs['example_entries']), 2)
-        self.assertEqual(call_args.kwargs['max_new_tokens'], 0)
-        mocks['load_data'].assert_called_once()
-        mocks['get_examples'].assert_called_once()
-        self.mock_exporter_instance.save_entry.assert_called_once_with(entry_text="Mocked journal entry")
-
-    def test_custom_arguments(self):
-        """Test main() with various custom arguments."""
-        mocks = self.common_mocks()
-        
-        test_tone = ALL_AVAILABLE_EMOTIONS[1] if len(ALL_AVAILABLE_EMOTIONS) > 1 else "sad"
-        cli_args = [
-            'main.py', 
-            '--num_days', '2',
-            '--entries_per_day', '1',
-            '--avg_word_count', '150',
-            '--tone', test_tone,
-            '--output_dir', 'custom_output',
-            '--num_examples_prompt', '2',
-            '--max_generation_tokens', '200',
-            '--start_date', '20230101'
-        ]
-        with patch.object(sys, 'argv', cli_args):
-            main()
-
-        mocks['ExporterClass'].assert_called_once_with(output_dir='custom_output')
-        self.assertEqual(self.mock_generator_instance.generate_entry.call_count, 2 * 1)
-        first_call_args = self.mock_generator_instance.generate_entry.call_args_list[0]
-        self.assertEqual(first_call_args.kwargs['target_emotion'], test_tone)
-        self.assertEqual(first_call_args.kwargs['avg_word_count'], 150)
-        self.assertEqual(len(first_call_args.kwargs['example_entries']), 2)
-        self.assertEqual(first_call_args.kwargs['max_new_tokens'], 200)
-        mocks['load_data'].assert_called_once()
-        self.assertEqual(mocks['get_examples'].call_count, 2 * 1)
-        self.assertEqual(mocks['get_examples'].call_args.args[2], 2)
-
-    def test_disable_examples(self):
-        """Test main() with --num_examples_prompt 0."""
-        mocks = self.common_mocks()
-        
-        test_tone = ALL_AVAILABLE_EMOTIONS[0] if ALL_AVAILABLE_EMOTIONS else "neutral"
-        cli_args = ['main.py', '--tone', test_tone, '--num_examples_prompt', '0']
-        with patch.object(sys, 'argv', cli_args):
-            main()
-
-        mocks['load_data'].assert_not_called()
-        mocks['get_examples'].assert_not_called()
-        call_args = self.mock_generator_instance.generate_entry.call_args
-        self.assertEqual(call_args.kwargs['example_entries'], [])
-
-    @patch('builtins.print')
-    def test_missing_tone_argument(self, mock_print):
-        """Test that argparse exits if --tone is missing."""
-        mocks = self.common_mocks()
-        
-        cli_args = ['main.py', '--num_days', '1']
-        with patch.object(sys, 'argv', cli_args):
-            with self.assertRaises(SystemExit):
-                main()
-
-    def test_invalid_tone_choice(self):
-        """Test that argparse exits if --tone is invalid."""
-        mocks = self.common_mocks()
-        
-        cli_args = ['main.py', '--tone', 'non_existent_emotion']
-        with patch.object(sys, 'argv', cli_args):
-            with self.assertRaises(SystemExit):
-                main()
-
-    def test_data_loading_failure(self):
-        """Test how main handles failure in load_and_preprocess_data."""
-        mocks = self.common_mocks()
-        
-        mocks['load_data'].side_effect = Exception("Failed to load CSV")
-        
-        test_tone = ALL_AVAILABLE_EMOTIONS[0] if ALL_AVAILABLE_EMOTIONS else "curious"
-        cli_args = ['main.py', '--tone', test_tone, '--num_examples_prompt', '1']
-        
-        with patch.object(sys, 'argv', cli_args):
-            main()
-        
-        mocks['load_data'].assert_called_once()
-        mocks['get_examples'].assert_not_called()
-        
-        call_args = self.mock_generator_instance.generate_entry.call_args
-        self.assertEqual(call_args.kwargs['example_entries'], [])
-
-if __name__ == '__main__':
-    unittest.main() 
\ No newline at end of file
+import threading
+from contextlib import ExitStack
+from argparse import Namespace
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch, call
+
+import numpy as np
+import pytest
+
+# src/ is put on sys.path by tests/conftest.py
+import main as main_module
+from main import main, build_arg_parser, batch_by_word_count, format_day_dates, DEFAULT_OUTPUT_DIR, ALL_AVAILABLE_EMOTIONS
+
+TEST_TONE = ALL_AVAILABLE_EMOTIONS[0] if ALL_AVAILABLE_EMOTIONS else "happy"
+CUSTOM_TONE = ALL_AVAILABLE_EMOTIONS[1] if len(ALL_AVAILABLE_EMOTIONS) > 1 else "sad"
+# The parser's defaults, parsed once; tests that aren't about parsing start from these and skip argparse
+DEFAULT_ARGS = vars(build_arg_parser().parse_args(['--tone', TEST_TONE]))
+
+# Shared return values for the data mocks: main.py only passes them along, so one immutable preset serves every test
+_DUMMY_DF = object()
+_EXAMPLES = ("example 1", "example 2")
+
+# Collaborators main.py uses: the name tests refer to each mock by -> the attribute patched on the main module
+PATCH_TARGETS = {
+    'load_dotenv': 'load_dotenv', # if main directly calls it
+    'load_data': 'load_and_preprocess_data',
+    'SamplerClass': 'EmotionSampler',
+    'GeneratorClass': 'JournalGenerator',
+    'ExporterClass': 'JournalExporter',
+}
+# Classes are mocked with spec_set, so their instances only accept methods the real class has.
+# spec_set takes a single dir() of the class; autospec would walk every signature on each patch
+SPEC_SET_TARGETS = {'EmotionSampler', 'JournalGenerator', 'JournalExporter'}
+
+# --- Fixtures and helpers --- #
+
+@pytest.fixture
+def main_mocks():
+    """Patches every collaborator main.py uses and yields the mocks, with default behaviour configured."""
+    # One ExitStack scopes the patches to this test; nothing relies on patch.stopall's global registry
+    with ExitStack() as stack:
+        # Patch the already imported module object rather than re-resolving a 'main.X' target string per patch
+        mocks = SimpleNamespace(**{
+            name: stack.enter_context(patch.object(main_module, attribute, spec_set=attribute in SPEC_SET_TARGETS or None))
+            for name, attribute in PATCH_TARGETS.items()})
+        # Mock the JournalGenerator instance and its batched agenerate_entries coroutine (an AsyncMock via spec_set)
+        mocks.generator = mocks.GeneratorClass.return_value
+        mocks.generator.agenerate_entries.side_effect = \
+            lambda entry_requests, **kwargs: ["Mocked journal entry"] * len(entry_requests)
+
+        # Mock the JournalExporter instance and its batched save_entries method
+        mocks.exporter = mocks.ExporterClass.return_value
+        mocks.exporter.save_entries.side_effect = \
+            lambda entry_texts, **kwargs: ["mocked_entry.txt"] * len(entry_texts)
+
+        # Mock data loading to return a stand-in for the DataFrame
+        mocks.load_data.return_value = _DUMMY_DF # Simulate successful load
+        # Examples are drawn through the EmotionSampler instance built from the loaded data
+        mocks.get_examples = mocks.SamplerClass.return_value.sample
+        mocks.get_examples.return_value = _EXAMPLES
+        yield mocks
+
+def run_main(monkeypatch, *cli_args):
+    """Runs main() as if invoked as `python main.py <cli_args>`."""
+    monkeypatch.setattr(sys, 'argv', ['main.py', *cli_args])
+    main()
+
+def run_main_with(**overrides):
+    """Runs main() on already parsed arguments: the parser's defaults with overrides applied."""
+    main(Namespace(**{**DEFAULT_ARGS, **overrides}))
+
+def generated_requests(mocks):
+    """Return every entry request passed to agenerate_entries, across all batches, in order."""
+    return [entry_request
+            for batch_call in mocks.generator.agenerate_entries.call_args_list
+            for entry_request in batch_call.args[0]]
+
+# --- Tests for argument handling and the generation run --- #
+
+@pytest.mark.parametrize("cli_args, expected_output_dir, expected_request, expected_num_examples, expected_num_entries, expected_sample_calls", [
+    pytest.param(
+        ['--tone', TEST_TONE],
+        DEFAULT_OUTPUT_DIR,
+        {'target_emotion': TEST_TONE, 'avg_word_count': 100, 'max_new_tokens': 0},
+        2,
+        1,
+        [call(TEST_TONE, 3)],
+        id="defaults"),
+    pytest.param(
+        ['--num_days', '2', '--entries_per_day', '1', '--avg_word_count', '150', '--tone', CUSTOM_TONE,
+         '--output_dir', 'custom_output', '--num_examples_prompt', '2', '--max_generation_tokens', '200',
+         '--start_date', '20230101'],
+        'custom_output',
+        {'target_emotion': CUSTOM_TONE, 'avg_word_count': 150, 'max_new_tokens': 200},
+        2,
+        2 * 1,
+        [call(CUSTOM_TONE, 2)] * (2 * 1),
+        id="custom"),
+    pytest.param(
+        ['--tone', TEST_TONE, '--num_examples_prompt', '0'],
+        DEFAULT_OUTPUT_DIR,
+        {'target_emotion': TEST_TONE, 'avg_word_count': 100, 'max_new_tokens': 0},
+        0,
+        1,
+        [], # Examples disabled: the dataset is never loaded or sampled
+        id="examples-disabled"),
+])
+def test_cli_arguments_shape_the_run(main_mocks, monkeypatch, cli_args, expected_output_dir, expected_request,
+                                     expected_num_examples, expected_num_entries, expected_sample_calls):
+    """Test that main() builds the exporter, entry requests and example draws the arguments ask for."""
+    run_main(monkeypatch, *cli_args)
+
+    main_mocks.GeneratorClass.assert_called_once_with()
+    main_mocks.ExporterClass.assert_called_once_with(output_dir=expected_output_dir)
+    batch_calls = main_mocks.generator.agenerate_entries.call_args_list
+    assert [batch_call.kwargs.get('max_concurrent') for batch_call in batch_calls] == [8] * len(batch_calls)
+    entry_requests = generated_requests(main_mocks)
+    assert len(entry_requests) == expected_num_entries
+    for entry_request in entry_requests:
+        # One comparison over the checked fields gives a single diff naming every mismatch
+        assert {key: entry_request.get(key) for key in expected_request} == expected_request
+        assert len(entry_request['example_entries']) == expected_num_examples
+
+    assert main_mocks.get_examples.call_args_list == expected_sample_calls
+    if expected_sample_calls:
+        main_mocks.load_data.assert_called_once()
+        assert main_mocks.SamplerClass.call_args.args == (_DUMMY_DF,)
+    else:
+        main_mocks.load_data.assert_not_called()
+    main_mocks.exporter.save_entries.assert_called_once_with(["Mocked journal entry"] * expected_num_entries, durable=False)
+
+def test_entries_are_generated_in_batches(main_mocks):
+    """Test that main() splits the planned entries into --max_batch_size batches and saves each batch."""
+    run_main_with(num_days=5, max_batch_size=2)
+
+    batch_calls = main_mocks.generator.agenerate_entries.call_args_list
+    assert [len(batch_call.args[0]) for batch_call in batch_calls] == [2, 2, 1]
+    assert [batch_call.kwargs.get('max_concurrent') for batch_call in batch_calls] == [2] * len(batch_calls)
+    assert main_mocks.exporter.save_entries.call_count == 3
+
+def test_all_batches_share_one_event_loop(main_mocks):
+    """Test that every batch is awaited on the same loop, as the SDK's async client is bound to the loop it first ran on."""
+    bound_loop = None
+
+    async def loop_bound_agenerate_entries(entry_requests, **kwargs):
+        nonlocal bound_loop
+        running_loop = asyncio.get_running_loop()
+        if bound_loop is None:
+            bound_loop = running_loop
+        elif bound_loop is not running_loop:
+            raise RuntimeError("Event loop is closed")
+        return ["Mocked journal entry"] * len(entry_requests)
+
+    main_mocks.generator.agenerate_entries.side_effect = loop_bound_agenerate_entries
+
+    run_main_with(num_days=3, max_batch_size=1)
+
+    assert main_mocks.generator.agenerate_entries.await_count == 3
+    assert [saved_call.args[0] for saved_call in main_mocks.exporter.save_entries.call_args_list] == \
+        [["Mocked journal entry"]] * 3
+
+def test_avg_word_counts_are_cycled_and_batched_by_length(main_mocks):
+    """Test that --avg_word_counts is cycled across entries and entries of similar length share a batch."""
+    run_main_with(num_days=4, avg_word_counts=[200, 50])
+
+    batch_calls = main_mocks.generator.agenerate_entries.call_args_list
+    assert [[entry_request['avg_word_count'] for entry_request in batch_call.args[0]] for batch_call in batch_calls] == \
+        [[50, 50], [200, 200]]
+
+@pytest.mark.parametrize("bad_argument", [
+    ['--avg_word_counts', 'fifty'],
+    ['--avg_word_counts', '50,-10'],
+    ['--start_date', '2024-01-31'],
+    ['--start_date', '20240231'],
+    ['--num_days', '-1'],
+    ['--avg_word_count', '0'],
+    ['--max_batch_size', '0'],
+    ['--num_examples_prompt', 'three'],
+    ['--seed', '-1'],
+])
+def test_invalid_arguments_are_rejected(main_mocks, monkeypatch, bad_argument):
+    """Test that malformed or out-of-range values are rejected while parsing arguments."""
+    with pytest.raises(SystemExit):
+        run_main(monkeypatch, '--tone', TEST_TONE, *bad_argument)
+    main_mocks.GeneratorClass.assert_not_called()
+
+def test_saving_overlaps_next_batch_generation(main_mocks):
+    """Test that a batch is written in the background while the next batch is being generated."""
+    second_batch_started = threading.Event()
+    first_save_overlapped = []
+
+    def fake_agenerate_entries(entry_requests, **kwargs):
+        if main_mocks.generator.agenerate_entries.call_count == 2:
+            second_batch_started.set()
+        return ["Mocked journal entry"] * len(entry_requests)
+
+    def fake_save_entries(entry_texts, **kwargs):
+        if not first_save_overlapped:
+            # Only finishes promptly if generation carried on without waiting for this save
+            first_save_overlapped.append(second_batch_started.wait(timeout=5))
+        return ["mocked_entry.txt"] * len(entry_texts)
+
+    main_mocks.generator.agenerate_entries.side_effect = fake_agenerate_entries
+    main_mocks.exporter.save_entries.side_effect = fake_save_entries
+
+    run_main_with(num_days=2, max_batch_size=1)
+
+    assert first_save_overlapped == [True]
+    assert main_mocks.exporter.save_entries.call_count == 2
+
+def test_seed_makes_example_sampling_reproducible(main_mocks):
+    """Test that --seed seeds the generator the example sampler draws with."""
+    run_main_with(seed=7)
+
+    sampler_kwargs = main_mocks.SamplerClass.call_args.kwargs
+    assert 'rng' in sampler_kwargs, "EmotionSampler should be given an rng"
+    sampler_rng = sampler_kwargs['rng']
+    assert sampler_rng.integers(1_000_000, size=5).tolist() == np.random.default_rng(7).integers(1_000_000, size=5).tolist()
+
+def test_entries_are_dated_from_start_date(main_mocks, capsys):
+    """Test that each day's date is derived from --start_date, rolling over month boundaries."""
+    run_main_with(num_days=2, start_date=datetime(2024, 1, 31))
+
+    printed = capsys.readouterr().out
+    assert "\n== Day 1 of 2 (Date: 20240131) ==" in printed
+    assert "\n== Day 2 of 2 (Date: 20240201) ==" in printed
+
+def test_failed_generations_are_not_saved(main_mocks):
+    """Test that entries the generator returns empty are skipped rather than saved."""
+    main_mocks.generator.agenerate_entries.side_effect = None
+    main_mocks.generator.agenerate_entries.return_value = ["Entry one", "", "Entry three"]
+
+    run_main_with(num_days=3)
+
+    main_mocks.exporter.save_entries.assert_called_once_with(["Entry one", "Entry three"], durable=False)
+
+def test_durable_writes_flag(main_mocks):
+    """Test that --durable_writes asks the exporter to fsync each saved batch."""
+    run_main_with(durable_writes=True)
+
+    assert main_mocks.exporter.save_entries.call_args.kwargs.get('durable') is True
+
+def test_missing_tone_argument(main_mocks, monkeypatch):
+    """Test that argparse exits if --tone is missing."""
+    with pytest.raises(SystemExit):
+        run_main(monkeypatch, '--num_days', '1')
+
+def test_invalid_tone_choice(main_mocks, monkeypatch):
+    """Test that argparse exits if --tone is invalid."""
+    with pytest.raises(SystemExit):
+        run_main(monkeypatch, '--tone', 'non_existent_emotion')
+
+def test_data_loading_failure(main_mocks):
+    """Test how main handles failure in load_and_preprocess_data."""
+    main_mocks.load_data.side_effect = Exception("Failed to load CSV")
+
+    run_main_with(tone=TEST_TONE, num_examples_prompt=1)
+
+    main_mocks.load_data.assert_called_once()
+    main_mocks.get_examples.assert_not_called()
+    assert generated_requests(main_mocks)[0]['example_entries'] == []
+
+# --- Tests for the planning helpers --- #
+
+def test_format_day_dates_vectorized_matches_strftime():
+    """Test that the NumPy date path produces the same strings as per-day strftime, across a leap day."""
+    start_date = datetime(2024, 2, 20, 15, 30)
+    expected = [(start_date + timedelta(days=day_num)).strftime("%Y%m%d") for day_num in range(400)]
+    assert format_day_dates(start_date, 400) == expected
+    assert format_day_dates(start_date, 3) == expected[:3] # Short runs use strftime directly
+    assert format_day_dates(start_date, 0) == []
+
+def test_batch_by_word_count():
+    """Test that batches never mix word count buckets and respect the batch size."""
+    planned_entries = [(index, 1, "20240101", {"avg_word_count": word_count})
+                       for index, word_count in enumerate([100, 300, 110, 95, 290])]
+    batches = batch_by_word_count(planned_entries, batch_size=2, bucket_width=50)
+    assert [[entry[0] for entry in batch] for batch in batches] == [[0, 2], [3], [1, 4]]
@@ -1,17 +1,16 @@
 # tests/test_utils.py
 import pytest
-import sys
-import os
-from nltk.tokenize import word_tokenize # Import for smart_truncate_text tests
+import numpy as np
 
-# Add the src directory to the Python path to allow imports of utils
-# This is a common pattern for structuring tests.
-# Adjust if your project structure or test runner handles this differently.
-current_dir = os.path.dirname(os.path.abspath(__file__))
-src_dir = os.path.join(current_dir, "..", "src")
-sys.path.insert(0, src_dir)
+import utils # src/ is put on sys.path by tests/conftest.py
 
-import utils # Now we can import from src.utils
+# --- Tests for filename helpers --- #
+
+@pytest.mark.parametrize("prefix", ["journal", "entry"])
+def test_make_filename_factory_matches_construct_filename(prefix):
+    filename_for = utils.make_filename_factory(prefix)
+    unique_id = "20231101_100000123456_000001"
+    assert filename_for(unique_id) == utils.construct_filename(unique_id, prefix) == f"{prefix}_{unique_id}.txt"
 
 # --- Tests for clean_generated_text --- #
 
@@ -27,6 +26,18 @@ def test_clean_generated_text_strip_whitespace():
 def test_clean_generated_text_only_whitespace():
     assert utils.clean_generated_text("   \n\t  ") == ""
 
+def test_clean_generated_text_strips_echoed_label():
+    assert utils.clean_generated_text("  New Journal Entry: Today was calm.  ") == "Today was calm."
+    assert utils.clean_generated_text("here is a journal entry:\nToday was calm.") == "Today was calm."
+
+def test_clean_generated_text_keeps_label_like_text_mid_entry():
+    text = "I wrote a new journal entry: it helped."
+    assert utils.clean_generated_text(text) == text
+
+def test_clean_generated_text_batch_matches_single():
+    texts = ["", "  leading and trailing  ", "Entry: Short one.", "This is clean."]
+    assert utils.clean_generated_text_batch(texts) == [utils.clean_generated_text(text) for text in texts]
+
 # --- Tests for count_words (assuming it now uses text.split()) --- #
 
 def test_count_words_empty():
@@ -45,8 +56,12 @@ def test_count_words_with_newlines():
 
 # --- Tests for check_word_count_adherence --- #
 
+def _assert_adherence(result, expected_adherent, expected_dev_approx):
+    is_adherent, deviation = result
+    assert is_adherent == expected_adherent
+    assert abs(deviation - expected_dev_approx) < 0.001
+
 @pytest.mark.parametrize("actual, target, tolerance, expected_adherent, expected_dev_approx", [
-    # Existing tests for explicit tolerances
     (100, 100, 0.20, True, 0.0),
     (80, 100, 0.20, True, -0.20),
     (120, 100, 0.20, True, 0.20),
@@ -57,58 +72,87 @@ def test_count_words_with_newlines():
     (56, 50, 0.10, False, 0.12),  # 50 * 1.1 = 55
     (0, 0, 0.20, True, 0.0),    
     (10, 0, 0.20, False, 0.0),   
-    # New tests for the 0.50 default tolerance (tolerance parameter will be None in call)
-    (100, 100, None, True, 0.0),      # Exact match
-    (50, 100, None, True, -0.50),     # Lower bound (100 * (1-0.5) = 50)
-    (150, 100, None, True, 0.50),    # Upper bound (100 * (1+0.5) = 150)
-    (49, 100, None, False, -0.51),   # Just outside lower bound
-    (151, 100, None, False, 0.51),   # Just outside upper bound
-    (75, 100, None, True, -0.25),    # Well within 50% tolerance
-    (125, 100, None, True, 0.25),    # Well within 50% tolerance
+    # Exactly at the tolerance is adherent, even where target * (1 + tol) rounds just below the count (114.99999999999999)
+    (115, 100, 0.15, True, 0.15),
+    (85, 100, 0.15, True, -0.15),
+    (116, 100, 0.15, False, 0.16),
 ])
-def test_check_word_count_adherence(actual, target, tolerance, expected_adherent, expected_dev_approx):
-    if tolerance is None: # Test default tolerance
-        is_adherent, deviation = utils.check_word_count_adherence(actual, target)
-    else: # Test with explicit tolerance
-        is_adherent, deviation = utils.check_word_count_adherence(actual, target, tolerance)
-    assert is_adherent == expected_adherent
-    assert abs(deviation - expected_dev_approx) < 0.001 
+def test_check_adherence_explicit_tol(actual, target, tolerance, expected_adherent, expected_dev_approx):
+    _assert_adherence(utils.check_word_count_adherence(actual, target, tolerance), expected_adherent, expected_dev_approx)
+
+# The default tolerance is 0.50
+@pytest.mark.parametrize("actual, target, expected_adherent, expected_dev_approx", [
+    (100, 100, True, 0.0),      # Exact match
+    (50, 100, True, -0.50),     # Lower bound (100 * (1-0.5) = 50)
+    (150, 100, True, 0.50),    # Upper bound (100 * (1+0.5) = 150)
+    (49, 100, False, -0.51),   # Just outside lower bound
+    (151, 100, False, 0.51),   # Just outside upper bound
+    (75, 100, True, -0.25),    # Well within 50% tolerance
+    (125, 100, True, 0.25),    # Well within 50% tolerance
+])
+def test_check_adherence_default_tol(actual, target, expected_adherent, expected_dev_approx):
+    _assert_adherence(utils.check_word_count_adherence(actual, target), expected_adherent, expected_dev_approx)
+
+def test_count_words_batch_matches_count_words():
+    texts = ["", "Hello world", "Hello, world!", "First line.\nSecond line."]
+    counts = utils.count_words_batch(texts)
+    assert counts.dtype == np.int32
+    assert counts.tolist() == [utils.count_words(text) for text in texts]
+
+def test_check_word_count_adherence_batch_matches_scalar():
+    cases = [(100, 100), (50, 100), (49, 100), (151, 100), (0, 0), (10, 0)]
+    counts = np.array([actual for actual, _ in cases])
+    targets = np.array([target for _, target in cases])
+    is_adherent, deviation = utils.check_word_count_adherence_batch(counts, targets)
+    for (actual, target), adherent, dev in zip(cases, is_adherent, deviation):
+        expected_adherent, expected_dev = utils.check_word_count_adherence(actual, target)
+        assert adherent == expected_adherent
+        assert abs(dev - expected_dev) < 0.001
+
+def test_check_word_count_adherence_batch_shared_target():
+    is_adherent, deviation = utils.check_word_count_adherence_batch(np.array([80, 121]), 100, 0.20)
+    assert is_adherent.tolist() == [True, False]
+    assert np.allclose(deviation, [-0.20, 0.21])
+
+def test_check_word_count_adherence_batch_exact_tolerance_is_adherent():
+    is_adherent, _ = utils.check_word_count_adherence_batch(np.array([85, 115, 116]), 100, 0.15)
+    assert is_adherent.tolist() == [True, True, False]
 
 # --- Tests for smart_truncate_text --- #
-# Assuming smart_truncate_text internally still uses nltk.word_tokenize for its logic
+# smart_truncate_text counts words the same way as count_words (runs of non-whitespace)
 
 TEXT_FOR_TRUNCATION = "This is the first sentence. This is the second sentence, which is a bit longer. And finally, the third sentence is here to make it long enough for truncation exercises."
-# NLTK word_tokenize(TEXT_FOR_TRUNCATION) -> 36 tokens
+# count_words(TEXT_FOR_TRUNCATION) -> 30 words
+_TRUNCATION_WORDS = TEXT_FOR_TRUNCATION.split()
 
 def test_smart_truncate_already_short():
     text = "This is short enough."
-    # NLTK tokens: 5
+    # Words: 4
     assert utils.smart_truncate_text(text, 10, max_overshoot_words=2) == text
 
 def test_smart_truncate_slightly_over_within_overshoot():
     text = "This is just a tiny bit over the target allowed."
-    # NLTK tokens: 11
+    # Words: 10
     assert utils.smart_truncate_text(text, 9, max_overshoot_words=2) == text
 
 def test_smart_truncate_needs_truncation_simple():
-    target_wc_nltk = 5 # Target based on NLTK tokens for smart_truncate_text internal logic
+    target_wc = 4
     original_text = "This is the first sentence."
-    # NLTK tokens of original_text: ['This', 'is', 'the', 'first', 'sentence', '.'] -> 6 tokens
-    truncated = utils.smart_truncate_text(original_text, target_wc_nltk, max_overshoot_words=0)
-    # smart_truncate_text truncates to target_wc_nltk NLTK tokens
-    assert len(word_tokenize(truncated)) == target_wc_nltk
-    # Expected based on NLTK word_tokenize: words[:5] -> ['This', 'is', 'the', 'first', 'sentence']
-    # Joined: "This is the first sentence"
-    assert truncated == "This is the first sentence"
+    # Words of original_text: ['This', 'is', 'the', 'first', 'sentence.'] -> 5 words
+    truncated = utils.smart_truncate_text(original_text, target_wc, max_overshoot_words=0)
+    assert truncated.split() == ['This', 'is', 'the', 'first']
 
 def test_smart_truncate_longer_text():
-    target_wc_nltk = 15 
-    # TEXT_FOR_TRUNCATION has 36 NLTK tokens
-    truncated = utils.smart_truncate_text(TEXT_FOR_TRUNCATION, target_wc_nltk, max_overshoot_words=3)
-    # Assert based on NLTK token count for the result, as smart_truncate_text uses it
-    assert len(word_tokenize(truncated)) == target_wc_nltk
-    expected_start = "This is the first sentence . This is the second sentence , which is a"
-    assert truncated == expected_start
+    target_wc = 15 
+    truncated = utils.smart_truncate_text(TEXT_FOR_TRUNCATION, target_wc, max_overshoot_words=3)
+    words = truncated.split()
+    assert len(words) == target_wc
+    # Punctuation stays attached to its word, so the result is exactly the first target_wc words
+    assert words == _TRUNCATION_WORDS[:target_wc]
+
+def test_smart_truncate_normalizes_whitespace_when_truncating():
+    text = "One  two\nthree\tfour five six"
+    assert utils.smart_truncate_text(text, 4, max_overshoot_words=0) == "One two three four"
 
 # It would be good to also test the old filename utils if they are still used.
 # For now, assuming they are being phased out by the new exporter logic.